@@ -2,8 +2,12 @@ import os
 import re
 import threading
 import traceback
-import inspect
-from contextlib import contextmanager
+import functools
+import difflib
+import collections
+import queue
+import struct
+import concurrent.futures
 import time
 import lldb
 
@@ -14,6 +18,224 @@ def list_replace(list, old_value, new_value):
     except ValueError:
         pass
 
+DIFF_MATCH_LIMIT = 200
+
+# NOTE: Calculate the hunks (old_start, old_end, new_start, new_end) that turn old_lines into new_lines. Common prefix and suffix are trimmed first so the common case of a few changed lines stays linear.
+# Matching lines within the changed middle is close to quadratic, so a middle longer than match_limit lines is replaced as a single hunk instead
+def diff_lines(old_lines, new_lines, match_limit = DIFF_MATCH_LIMIT):
+    prefix = 0
+    max_prefix = min(len(old_lines), len(new_lines))
+    while prefix < max_prefix and old_lines[prefix] == new_lines[prefix]:
+        prefix += 1
+    suffix = 0
+    max_suffix = max_prefix - prefix
+    while suffix < max_suffix and old_lines[-1 - suffix] == new_lines[-1 - suffix]:
+        suffix += 1
+
+    old_middle = old_lines[prefix:len(old_lines) - suffix]
+    new_middle = new_lines[prefix:len(new_lines) - suffix]
+    hunks = []
+    if max(len(old_middle), len(new_middle)) > match_limit:
+        hunks.append((prefix, prefix + len(old_middle), prefix, prefix + len(new_middle)))
+    elif old_middle or new_middle:
+        matcher = difflib.SequenceMatcher(None, old_middle, new_middle, autojunk=False)
+        for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+            if tag != 'equal':
+                hunks.append((prefix + old_start, prefix + old_end, prefix + new_start, prefix + new_end))
+    return hunks
+
+# NOTE: Context methods decorated with this can be called from any thread. Calls from other threads (LLDB event loop, timers) are queued by Context.dispatch and run on the Neovim thread in order.
+# Queued calls with the same coalesce key supersede each other, only the latest one runs
+def neovim_thread(coalesce = None):
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args):
+            if threading.current_thread().ident == self.tid:
+                return method(self, *args)
+            else:
+                self.dispatch(method, self, *args, coalesce=coalesce)
+        return wrapper
+    return decorator
+
+# NOTE: Process output is kept as one log of chunks tagged with their stream instead of one string per stream, so each byte is stored once.
+# The total size is capped, oldest chunks are evicted first
+class OutputLog:
+    def __init__(self, limit):
+        self.limit = limit
+        self.chunks = collections.deque()
+        self.size = 0
+
+    def clear(self):
+        self.chunks.clear()
+        self.size = 0
+
+    def append(self, stream, text):
+        if text:
+            self.chunks.append((stream, text))
+            self.size += len(text)
+            while self.size > self.limit:
+                if len(self.chunks) > 1:
+                    _, evicted_text = self.chunks.popleft()
+                    self.size -= len(evicted_text)
+                else:
+                    # NOTE: A single chunk larger than the limit keeps its tail only
+                    stream, text = self.chunks.popleft()
+                    text = text[-self.limit:]
+                    self.chunks.append((stream, text))
+                    self.size = len(text)
+
+    # NOTE: 'both' is a view of stdout and stderr, other views (including 'log' of logpoint messages) are filtered by stream
+    @staticmethod
+    def in_view(view, stream):
+        return stream == view or (view == 'both' and stream in ('stdout', 'stderr'))
+
+    def get_text(self, view):
+        return ''.join(text for stream, text in self.chunks if self.in_view(view, stream))
+
+# NOTE: Split output text into complete lines and the trailing partial line, which is completed by later output
+def split_output_lines(text):
+    lines = text.split('\n')
+    return [line[:-1] if line.endswith('\r') else line for line in lines[:-1]], lines[-1]
+
+# NOTE: Formats of primitive types by basic type and byte size, used to decode memory of pointer@length watches in bulk. Character types are left to LLDB, which formats them as characters.
+# Floating point values are formatted with the same number of significant digits as LLDB
+def get_memory_format(element_type):
+    basic_type = element_type.GetCanonicalType().GetBasicType()
+    byte_size = element_type.GetByteSize()
+    if basic_type in (lldb.eBasicTypeShort, lldb.eBasicTypeInt, lldb.eBasicTypeLong, lldb.eBasicTypeLongLong):
+        return { 2: 'h', 4: 'i', 8: 'q' }.get(byte_size), str
+    elif basic_type in (lldb.eBasicTypeUnsignedShort, lldb.eBasicTypeUnsignedInt, lldb.eBasicTypeUnsignedLong, lldb.eBasicTypeUnsignedLongLong):
+        return { 2: 'H', 4: 'I', 8: 'Q' }.get(byte_size), str
+    elif basic_type == lldb.eBasicTypeFloat and byte_size == 4:
+        return 'f', lambda value: f'{value:.9g}'
+    elif basic_type == lldb.eBasicTypeDouble and byte_size == 8:
+        return 'd', lambda value: f'{value:.17g}'
+    elif basic_type == lldb.eBasicTypeBool and byte_size == 1:
+        return '?', lambda value: 'true' if value else 'false'
+    return None, None
+
+# NOTE: A decoded element of a bulk memory read, standing in for the SBValue of the element in the watch window. The value is formatted when it's shown
+class MemoryValue:
+    def __init__(self, name, values, index, formatter):
+        self.name = name
+        self.values = values
+        self.index = index
+        self.formatter = formatter
+
+    def IsValid(self):
+        return True
+
+    def GetName(self):
+        return self.name
+
+    def GetValue(self):
+        return self.formatter(self.values[self.index])
+
+    def GetSummary(self):
+        return None
+
+    def MightHaveChildren(self):
+        return False
+
+# NOTE: Stands in for the value of a watch that is being evaluated in the background or whose evaluation timed out
+class PlaceholderValue:
+    def __init__(self, name, text):
+        self.name = name
+        self.text = text
+
+    def IsValid(self):
+        return True
+
+    def GetName(self):
+        return self.name
+
+    def GetValue(self):
+        return self.text
+
+    def GetSummary(self):
+        return None
+
+    def MightHaveChildren(self):
+        return False
+
+# NOTE: Placeholders of expressions in logpoint messages, e.g. 'i = {i}'
+LOGPOINT_EXPR_PATTERN = re.compile(r'\{([^{}]+)\}')
+
+# NOTE: Breakpoints are indexed by location (file, line), by file and by LLDB breakpoint id. They are kept in the order they were added for the breakpoint window, moving a breakpoint doesn't change its order
+class BreakpointStore:
+    def __init__(self):
+        self.breakpoints = {}
+        self.serial = 0
+        self.location_index = {}
+        self.file_index = {}
+        self.id_index = {}
+
+    def __iter__(self):
+        return iter(self.breakpoints.values())
+
+    def __len__(self):
+        return len(self.breakpoints)
+
+    def add(self, file, line, id = None):
+        self.serial += 1
+        breakpoint = { 'file': file, 'line': line, 'id': None, 'target_line': None, 'locations': None, 'condition': '', 'ignore_count': 0, 'thread': None, 'log': '', 'serial': self.serial }
+        self.breakpoints[breakpoint['serial']] = breakpoint
+        self.index_location(breakpoint)
+        self.set_id(breakpoint, id)
+        return breakpoint
+
+    def remove(self, breakpoint):
+        del self.breakpoints[breakpoint['serial']]
+        self.unindex_location(breakpoint)
+        self.set_id(breakpoint, None)
+
+    def find(self, file, line):
+        return self.location_index.get((file, line))
+
+    # NOTE: Breakpoints of a file keyed by line
+    def find_by_file(self, file):
+        return self.file_index.get(file, {})
+
+    def find_by_id(self, id):
+        return self.id_index.get(id)
+
+    # NOTE: The target line is the line the LLDB breakpoint was created for, the breakpoint line can move away from it when text changes. The number of resolved locations is unknown until it is set by the caller
+    def set_id(self, breakpoint, id):
+        if breakpoint['id'] is not None and self.id_index.get(breakpoint['id']) is breakpoint:
+            del self.id_index[breakpoint['id']]
+        breakpoint['id'] = id
+        breakpoint['target_line'] = breakpoint['line'] if id is not None else None
+        breakpoint['locations'] = None
+        if id is not None:
+            self.id_index[id] = breakpoint
+
+    # NOTE: Move breakpoints to new lines, moves is a list of (breakpoint, line). All moved breakpoints are unindexed first so that breakpoints can move onto each other's old lines.
+    # Breakpoints that land on a line taken by a breakpoint that isn't moved or by an earlier move are returned as duplicates. They are moved onto that line but left out of the location indexes, and are expected to be removed by the caller
+    def move(self, moves):
+        for breakpoint, line in moves:
+            self.unindex_location(breakpoint)
+        duplicates = []
+        for breakpoint, line in moves:
+            is_duplicate = (breakpoint['file'], line) in self.location_index
+            breakpoint['line'] = line
+            if is_duplicate:
+                duplicates.append(breakpoint)
+            else:
+                self.index_location(breakpoint)
+        return duplicates
+
+    def index_location(self, breakpoint):
+        self.location_index[(breakpoint['file'], breakpoint['line'])] = breakpoint
+        self.file_index.setdefault(breakpoint['file'], {})[breakpoint['line']] = breakpoint
+
+    def unindex_location(self, breakpoint):
+        if self.location_index.get((breakpoint['file'], breakpoint['line'])) is breakpoint:
+            del self.location_index[(breakpoint['file'], breakpoint['line'])]
+            file_breakpoints = self.file_index[breakpoint['file']]
+            del file_breakpoints[breakpoint['line']]
+            if not file_breakpoints:
+                del self.file_index[breakpoint['file']]
+
 # TODO
 # resource management (e.g. SBTarget), error handling (SBError vs IsValid), Python C++ interface
 # multiple processes per target?
@@ -28,18 +250,16 @@ def list_replace(list, old_value, new_value):
 # What is use_dynamic for variable inspection?
 
 # TODO
-# Stepping problem, two handler can be called in the interleaved fashion, wtf? Currently solved through async_lock, https://github.com/neovim/pynvim/issues/441
-# matchdelete in nvim https://github.com/neovim/neovim/issues/12110
+# Stepping problem, two handler can be called in the interleaved fashion, wtf? Currently solved by draining all handlers from one dispatch queue, https://github.com/neovim/pynvim/issues/441
 # switch to win_execute in nvim
 # Configurable debugger window layout, window key mapping
 # Log breakpoint attach failure (is IsValid the right function to use?)
-# scrolling output window, can be solved by win_execute
 # Investigate wrong frame information, image lookup --verbose --address <pc>
 
 class Context:
     VIM_LLDB_WINDOW_KEY = 'vim_lldb'
-    VIM_LLDB_WINDOW_LOCK = 'vim_lldb_window_lock'
-    VIM_LLDB_WINDOW_MATCH = 'vim_lldb_window_match'
+    VIM_LLDB_WINDOW_HIGHLIGHT = 'vim_lldb_window_highlight'
+    VIM_LLDB_SYNC_BACK_GROUP = 'vim_lldb_sync_back'
     VIM_LLDB_SIGN_BREAKPOINT = 'vim_lldb_sign_breakpoint'
     VIM_LLDB_SIGN_CURSOR_SELECTED = 'vim_lldb_sign_cursor_selected'
     VIM_LLDB_SIGN_CURSOR_NOT_SELECTED = 'vim_lldb_sign_cursor_not_selected'
@@ -47,32 +267,99 @@ class Context:
     def __init__(self, nvim):
         self.nvim = nvim
         self.tid = threading.current_thread().ident
+        # NOTE: async_lock only guards the dispatch queue and whether a drain is scheduled, it's never held while a handler runs
         self.async_lock = threading.Lock()
-
-        self.sign_id = 0
-        self.command(f'highlight {self.VIM_LLDB_SIGN_BREAKPOINT}_HIGHLIGHT guifg=red')
-        self.call('sign_define', self.VIM_LLDB_SIGN_BREAKPOINT, {'text': '●', 'texthl': f'{self.VIM_LLDB_SIGN_BREAKPOINT}_HIGHLIGHT'})
-        self.command(f'highlight {self.VIM_LLDB_SIGN_CURSOR_SELECTED}_HIGHLIGHT guifg=yellow')
-        self.call('sign_define', self.VIM_LLDB_SIGN_CURSOR_SELECTED, {'text': '➨', 'texthl': f'{self.VIM_LLDB_SIGN_CURSOR_SELECTED}_HIGHLIGHT'})
-        self.command(f'highlight {self.VIM_LLDB_SIGN_CURSOR_NOT_SELECTED}_HIGHLIGHT guifg=lightgreen')
-        self.call('sign_define', self.VIM_LLDB_SIGN_CURSOR_NOT_SELECTED, {'text': '➨', 'texthl': f'{self.VIM_LLDB_SIGN_CURSOR_NOT_SELECTED}_HIGHLIGHT'})
+        self.dispatch_queue = collections.deque()
+        self.dispatch_scheduled = False
+        self.dispatch_queue_max_depth = 0
+        self.dispatch_coalesced_count = 0
+
+        # NOTE: Debugger window highlights are buffer highlights in their own namespace, so that they can be cleared and added in the same batch as the buffer content
+        self.window_highlight_namespace = self.nvim.api.create_namespace(self.VIM_LLDB_WINDOW_HIGHLIGHT)
+
+        # NOTE: Last rendered lines of each debugger window, so that only changed hunks are sent to Neovim
+        self.window_lines = {}
+        # NOTE: The output window is appended to between full renders. We remember the partial last line it shows and how much has been appended since the last full render
+        self.output_window_tail = ''
+        self.output_window_appended = 0
+        self.output_follow = self.get_option('output_follow', 1)
+        # NOTE: Read by the event loop thread, which cannot call into Neovim itself
+        self.output_flush_interval = self.get_option('output_flush_interval', 50) / 1000
+        self.output_flush_size = self.get_option('output_flush_size', 64 * 1024)
+
+        # NOTE: Markers are either legacy signs ('sign') or extmarks with one namespace per sign type ('extmark'), both are placed and removed in batches
+        self.marker_backend = self.get_option('marker_backend', 'sign')
+        # NOTE: Process cursor shows on top of breakpoint
+        self.sign_definitions = {
+            self.VIM_LLDB_SIGN_BREAKPOINT: { 'text': '●', 'color': 'red', 'priority': 1000 },
+            self.VIM_LLDB_SIGN_CURSOR_SELECTED: { 'text': '➨', 'color': 'yellow', 'priority': 2000 },
+            self.VIM_LLDB_SIGN_CURSOR_NOT_SELECTED: { 'text': '➨', 'color': 'lightgreen', 'priority': 2000 },
+        }
+        self.marker_namespaces = {}
+        for sign_type, sign_definition in self.sign_definitions.items():
+            self.command(f'highlight {sign_type}_HIGHLIGHT guifg={sign_definition["color"]}')
+            if self.marker_backend == 'extmark':
+                self.marker_namespaces[sign_type] = self.nvim.api.create_namespace(sign_type)
+            else:
+                self.call('sign_define', sign_type, {'text': sign_definition['text'], 'texthl': f'{sign_type}_HIGHLIGHT'})
+
+        # NOTE: Registries of listed buffers by path (and back) and debugger windows by window ID. They are filled once here and maintained from autocmds, so lookups don't need a round trip per buffer or window
+        self.buffer_registry = {}
+        self.buffer_files = {}
+        self.window_registry = {}
+        self.locked_windows = set()
+        for buffer_info in self.call('getbufinfo', { 'buflisted': 1 }):
+            self.register_buffer(buffer_info['bufnr'], buffer_info['name'])
+        for window_info in self.call('getwininfo'):
+            self.register_window(window_info['winid'], window_info['variables'].get(self.VIM_LLDB_WINDOW_KEY))
+
+        # NOTE: Only buffers with breakpoints sync marker positions back, through buffer-local autocmds. Typing in other buffers never reaches the plugin
+        self.sync_back_buffers = set()
+        self.command(f'augroup {self.VIM_LLDB_SYNC_BACK_GROUP} | autocmd! | augroup END')
 
         self.debugger = lldb.SBDebugger.Create()
         self.debugger.SetAsync(True)
         self.is_debugger_toggling = False
 
         self.targets = []
+        # NOTE: Targets are kept alive across launches, keyed by executable path. Breakpoint ids in the breakpoint store belong to breakpoint_target
+        self.target_cache = {}
+        self.target_progress = ''
+        # NOTE: Path of the executable most recently asked to load, the indexing of other executables stops early. The target definition waiting for its target to launch
+        self.preloading_path = None
+        self.launching_target = None
+        self.breakpoint_target = None
         self.selected_target = None
-        self.select_target()
 
         self.process_info = { 'state': 'exited', 'threads': [] }
         self.selected_thread_info = None
-        self.selected_frame_info_list = []
-        self.breakpoint_list = []
+        self.unwind_mode = self.get_option('unwind', 'lazy')
+        self.unwind_lock = threading.Lock()
+        # NOTE: Resolved frame records keyed by (module UUID, PC, is top frame, is inlined, block address), cleared when modules are loaded or unloaded. Source file existence is cached separately since it changes with the file system
+        self.frame_cache = {}
+        self.source_file_cache = {}
+        self.breakpoints = BreakpointStore()
+        # NOTE: Set by the event loop when modules are loaded or unloaded, which is when breakpoint locations can change
+        self.is_breakpoint_locations_stale = False
+        # NOTE: Log messages of logpoints keyed by breakpoint id, read by the event loop thread. It's replaced as a whole instead of modified in place
+        self.logpoints = {}
         self.watch_list = []
-        self.process_output = { 'both': '', 'stdout': '', 'stderr': '' }
+        self.watch_page_size = self.get_option('watch_page_size', 100)
+        # NOTE: Evaluated watch values keyed by (stop id, thread, frame, watch path) and for children also the page, so that moving between frames within a stop doesn't evaluate again. Cleared when the process resumes
+        self.watch_value_cache = {}
+        # NOTE: Expressions that need to run code in the process are evaluated one at a time by a background worker with a time budget. Results of an older generation (before the cache is cleared) are dropped
+        self.watch_timeout = self.get_option('watch_timeout', 500) / 1000
+        self.watch_generation = 0
+        self.watch_queue = queue.Queue()
+        threading.Thread(target=self.watch_worker, daemon=True).start()
+        self.process_output = OutputLog(self.get_option('output_limit', 1024 * 1024))
+        # NOTE: Logpoint messages are kept apart with their own limit, so that a hot logpoint doesn't evict the process output
+        self.log_output = OutputLog(self.get_option('log_limit', 1024 * 1024))
         self.selected_stream = 'both'
 
+        # NOTE: The default selection is preloaded as well, an explicit selection of another target supersedes it
+        self.select_target()
+
         self.exit_broadcaster = lldb.SBBroadcaster('exit_broadcaster')
         self.event_loop = threading.Thread(target=event_loop, args=(self,))
         self.event_loop.start()
@@ -83,48 +370,76 @@ class Context:
     def call(self, func, *args):
         return self.nvim.call(func, *args)
 
-    # NOTE: Use this funtion if the the Context method can be called from the event loop thread, it will automatcially dispatch an async_call if it's indeed called from event thread
-    def thread_guard(self):
-        if threading.current_thread().ident == self.tid:
-            return True
-        else:
-            frame_info = inspect.stack()[1]
-            function = getattr(Context, frame_info.function)
-            args_info = inspect.getargvalues(frame_info.frame)
-            args = list(map(args_info.locals.get, args_info.args))
-            self.nvim.async_call(function, *args)
-            return False
+    # NOTE: Options are global variables prefixed with vim_lldb_, e.g. g:vim_lldb_output_limit
+    def get_option(self, name, default):
+        return self.nvim.vars.get(f'vim_lldb_{name}', default)
+
+    # NOTE: Send a list of [api_function, [args]] in a single RPC round trip. Neovim stops at the first failing call and reports its index
+    def call_atomic(self, calls):
+        results, error = self.nvim.api.call_atomic(calls)
+        if error:
+            self.log_error(f'Atomic call {calls[error[0]][0]} failed: {error[2]}')
+        return results
+
+    # NOTE: Queue a handler call from another thread. Only one drain is scheduled on the Neovim thread at a time and it runs all queued handlers in order, so handlers never interleave.
+    # A call with a coalesce key replaces the queued calls with the same key that haven't started, e.g. a stop superseded by running again is never rendered. Other calls (e.g. output) keep their order
+    def dispatch(self, handler, *args, coalesce = None):
+        with self.async_lock:
+            if coalesce:
+                queue_length = len(self.dispatch_queue)
+                self.dispatch_queue = collections.deque(item for item in self.dispatch_queue if item[2] != coalesce)
+                self.dispatch_coalesced_count += queue_length - len(self.dispatch_queue)
+            self.dispatch_queue.append((handler, args, coalesce))
+            self.dispatch_queue_max_depth = max(self.dispatch_queue_max_depth, len(self.dispatch_queue))
+            schedule = not self.dispatch_scheduled
+            self.dispatch_scheduled = True
+        if schedule:
+            self.nvim.async_call(self.drain_dispatch_queue)
+
+    def drain_dispatch_queue(self):
+        while True:
+            with self.async_lock:
+                if not self.dispatch_queue:
+                    self.dispatch_scheduled = False
+                    return
+                handler, args, coalesce = self.dispatch_queue.popleft()
+            try:
+                handler(*args)
+            except Exception:
+                self.log_error(traceback.format_exc())
+
+    def get_dispatch_queue_depth(self):
+        with self.async_lock:
+            return { 'depth': len(self.dispatch_queue), 'max_depth': self.dispatch_queue_max_depth, 'coalesced': self.dispatch_coalesced_count }
 
     # NOTE: Pynvim echomsg doesn't handle multi-line string correctly, split into multiple lines
     def to_lines(self, value):
         return [repr(line) for line in value.split('\n')]
 
+    @neovim_thread()
     def log_info(self, value):
-        if self.thread_guard():
-            if type(value) == str:
-                for line in self.to_lines(value):
-                    self.command(f'echomsg {line}')
-            else:
-                self.command(f'echomsg {repr(value)}')
+        if type(value) == str:
+            for line in self.to_lines(value):
+                self.command(f'echomsg {line}')
+        else:
+            self.command(f'echomsg {repr(value)}')
 
+    @neovim_thread()
     def log_error(self, value):
-        if self.thread_guard():
-            if type(value) == str:
-                for line in self.to_lines(value):
-                    # NOTE: echoerr seems to be treated as throwing error, so we have to use echomsg instead
-                    self.command(f'echohl ErrorMsg')
-                    self.command(f'echomsg {line}')
-                    self.command(f'echohl Normal')
-            else:
+        if type(value) == str:
+            for line in self.to_lines(value):
+                # NOTE: echoerr seems to be treated as throwing error, so we have to use echomsg instead
                 self.command(f'echohl ErrorMsg')
-                self.command(f'echomsg {repr(value)}')
+                self.command(f'echomsg {line}')
                 self.command(f'echohl Normal')
+        else:
+            self.command(f'echohl ErrorMsg')
+            self.command(f'echomsg {repr(value)}')
+            self.command(f'echohl Normal')
 
+    # NOTE: Windows are identified by window ID
     def get_window(self):
-        return self.call('winnr')
-
-    def get_last_window(self):
-        return self.call('winnr', '#')
+        return self.call('win_getid')
 
     def get_window_count(self):
         return self.call('winnr', '$')
@@ -132,12 +447,6 @@ class Context:
     def get_buffer(self):
         return self.call('bufnr')
 
-    def get_buffer_count(self):
-        return self.call('bufnr', '$')
-
-    def is_buffer_valid(self, buffer):
-        return bool(self.call('buflisted', buffer))
-
     def get_window_buffer(self, window = 0):
         return self.call('winbufnr', window)
 
@@ -164,88 +473,136 @@ class Context:
 
     def get_buffer_file(self, buffer = 0):
         buffer = buffer or self.get_buffer()
+        if buffer in self.buffer_files:
+            return self.buffer_files[buffer]
         return os.path.abspath(self.call('bufname', buffer))
 
-    # NOTE: Sync a list of signs in memory to screen
-    def sync_signs(self, sign_type, sign_list):
-        buffer_count = self.get_buffer_count()
-        for buffer in range(1, buffer_count + 1):
-            if self.is_buffer_valid(buffer):
-                # NOTE: We need to calculate the diff between the signs on screen and signs in memory, since we can't just remove all signs and add new signs all together, which causes a visual flash for unchanged signs
-                buffer_curr_sign_list = self.call('sign_getplaced', buffer, { 'group': sign_type })[0]['signs']
-                buffer_sign_list = [sign for sign in sign_list if sign['file'] == self.get_buffer_file(buffer)]
-
-                # NOTE: Calculate signs on screen to remove
-                for buffer_curr_sign in buffer_curr_sign_list:
-                    found = False
-                    for buffer_sign in buffer_sign_list:
-                        if buffer_curr_sign['lnum'] == buffer_sign['line']:
-                            found = True
-                            break
-                    if not found:
-                        self.call('sign_unplace', sign_type, { 'buffer': buffer, 'id': buffer_curr_sign['id'] })
-
-                # NOTE: Calculate signs in memory to add
-                for buffer_sign in buffer_sign_list:
-                    found = False
-                    for buffer_curr_sign in buffer_curr_sign_list:
-                        if buffer_sign['line'] == buffer_curr_sign['lnum']:
-                            found = True
-                            break
-                    if not found:
-                        self.sign_id += 1
-                        # NOTE: Process cursor shows on top of breakpoint
-                        priorities = {self.VIM_LLDB_SIGN_BREAKPOINT: 1000, self.VIM_LLDB_SIGN_CURSOR_SELECTED: 2000, self.VIM_LLDB_SIGN_CURSOR_NOT_SELECTED: 2000}
-                        self.call('sign_place', self.sign_id, sign_type, sign_type, buffer,
-                             { 'lnum': buffer_sign['line'], 'priority': priorities[sign_type]})
-
-    # NOTE: Sync signs on screen back to memory
-    def sync_back_signs(self, sign_type, sign_list):
-        buffer = self.get_buffer()
-        buffer_curr_sign_list = sorted(self.call('sign_getplaced', buffer, { 'group': sign_type })[0]['signs'], key=lambda x: x['lnum'])
-        buffer_sign_list = sorted([sign for sign in sign_list if sign['file'] == self.get_buffer_file(buffer)], key=lambda x: x['line'])
+    def register_buffer(self, buffer, file):
+        self.unregister_buffer(buffer)
+        if file:
+            file = os.path.abspath(file)
+            self.buffer_registry[file] = buffer
+            self.buffer_files[buffer] = file
+
+    def unregister_buffer(self, buffer):
+        self.sync_back_buffers.discard(buffer)
+        file = self.buffer_files.pop(buffer, None)
+        if file and self.buffer_registry.get(file) == buffer:
+            del self.buffer_registry[file]
+
+    def register_window(self, window, name):
+        if name:
+            self.window_registry[window] = name
+
+    # NOTE: A new window showing the buffer of a debugger window is a split of that debugger window
+    def register_split_window(self, window, buffer):
+        for name, rendered in self.window_lines.items():
+            if rendered['buffer'] == buffer and self.check_window_exists(name):
+                self.register_window(window, name)
+                break
 
-        # NOTE: Since this function will only be called when text is changed, we assume the number of signs on screen and in memory are already aligned, so we only adjust the line number
-        has_change = False
-        for i in range(len(buffer_sign_list)):
-            if buffer_sign_list[i]['line'] != buffer_curr_sign_list[i]['lnum']:
-                buffer_sign_list[i]['line'] = buffer_curr_sign_list[i]['lnum']
-                has_change = True
+    def unregister_window(self, window):
+        self.window_registry.pop(window, None)
+        self.locked_windows.discard(window)
+
+    # NOTE: Get the (line, id) of markers on screen for each buffer and sign type. Signs come with getbufinfo, extmarks of all buffers are fetched in one atomic call
+    def get_placed_markers(self, buffer_infos, sign_types):
+        placed_markers = {}
+        if self.marker_backend == 'extmark':
+            calls = []
+            for buffer_info in buffer_infos:
+                for sign_type in sign_types:
+                    calls.append(['nvim_buf_get_extmarks', [buffer_info['bufnr'], self.marker_namespaces[sign_type], 0, -1, {}]])
+            results = iter(self.call_atomic(calls) if calls else [])
+            for buffer_info in buffer_infos:
+                buffer_markers = placed_markers[buffer_info['bufnr']] = {}
+                for sign_type in sign_types:
+                    buffer_markers[sign_type] = [(row + 1, marker_id) for marker_id, row, column in next(results, [])]
+        else:
+            for buffer_info in buffer_infos:
+                buffer_markers = placed_markers[buffer_info['bufnr']] = { sign_type: [] for sign_type in sign_types }
+                for placed_sign in buffer_info.get('signs', []):
+                    if placed_sign.get('group') in buffer_markers:
+                        buffer_markers[placed_sign['group']].append((placed_sign['lnum'], placed_sign['id']))
+        return placed_markers
+
+    # NOTE: Apply all marker changes in one round trip. place_list and unplace_list contain { 'type', 'buffer', 'line' } and { 'type', 'buffer', 'id' }
+    def place_markers(self, place_list, unplace_list):
+        calls = []
+        if self.marker_backend == 'extmark':
+            for marker in unplace_list:
+                calls.append(['nvim_buf_del_extmark', [marker['buffer'], self.marker_namespaces[marker['type']], marker['id']]])
+            for marker in place_list:
+                calls.append(['nvim_buf_set_extmark', [marker['buffer'], self.marker_namespaces[marker['type']], marker['line'] - 1, 0, {
+                    'sign_text': self.sign_definitions[marker['type']]['text'],
+                    'sign_hl_group': f'{marker["type"]}_HIGHLIGHT',
+                    'priority': self.sign_definitions[marker['type']]['priority'],
+                }]])
+        else:
+            if unplace_list:
+                calls.append(['nvim_call_function', ['sign_unplacelist', [[{ 'group': marker['type'], 'buffer': marker['buffer'], 'id': marker['id'] } for marker in unplace_list]]]])
+            # NOTE: Sign id 0 lets Neovim allocate a new id
+            if place_list:
+                calls.append(['nvim_call_function', ['sign_placelist', [[{ 'id': 0, 'group': marker['type'], 'name': marker['type'], 'buffer': marker['buffer'], 'lnum': marker['line'], 'priority': self.sign_definitions[marker['type']]['priority'] } for marker in place_list]]]])
+        if calls:
+            self.call_atomic(calls)
+
+    # NOTE: Sync signs in memory to screen, sign_index maps a sign type to its signs indexed by file, each file maps to a collection of lines. All listed buffers come from one getbufinfo call, and all changes are sent in one atomic call
+    def sync_signs(self, sign_index):
+        buffer_infos = [buffer_info for buffer_info in self.call('getbufinfo', { 'buflisted': 1 }) if buffer_info['name']]
+        placed_markers = self.get_placed_markers(buffer_infos, list(sign_index))
+
+        place_list = []
+        unplace_list = []
+        for buffer_info in buffer_infos:
+            buffer = buffer_info['bufnr']
+            file = os.path.abspath(buffer_info['name'])
+            for sign_type in sign_index:
+                lines = sign_index[sign_type].get(file, ())
+
+                # NOTE: We need to calculate the diff between the markers on screen and signs in memory, since we can't just remove all markers and add new markers all together, which causes a visual flash for unchanged markers.
+                # Duplicated markers on the same line are removed
+                placed_lines = set()
+                for line, marker_id in placed_markers[buffer][sign_type]:
+                    if line in placed_lines or line not in lines:
+                        unplace_list.append({ 'type': sign_type, 'buffer': buffer, 'id': marker_id })
+                    else:
+                        placed_lines.add(line)
+                # NOTE: Lines past the end of buffer can't hold an extmark
+                for line in lines:
+                    if line not in placed_lines and line <= buffer_info['linecount']:
+                        place_list.append({ 'type': sign_type, 'buffer': buffer, 'line': line })
 
-        # NOTE: Let caller know if update is needed
-        return has_change
+        self.place_markers(place_list, unplace_list)
+
+    def get_buffer_marker_lines(self, buffer, sign_type):
+        if self.marker_backend == 'extmark':
+            return sorted(row + 1 for marker_id, row, column in self.nvim.api.buf_get_extmarks(buffer, self.marker_namespaces[sign_type], 0, -1, {}))
+        else:
+            return sorted(sign['lnum'] for sign in self.call('sign_getplaced', buffer, { 'group': sign_type })[0]['signs'])
+
+    # NOTE: Sync breakpoint markers on screen back to memory, returns the breakpoints that moved onto the same line as another breakpoint
+    def sync_back_signs(self, buffer):
+        buffer_curr_line_list = self.get_buffer_marker_lines(buffer, self.VIM_LLDB_SIGN_BREAKPOINT)
+        buffer_breakpoint_list = sorted(self.breakpoints.find_by_file(self.get_buffer_file(buffer)).values(), key=lambda x: x['line'])
+
+        # NOTE: Since this function will only be called when text is changed, we assume the number of signs on screen and in memory are already aligned, so we only adjust the line number
+        moves = [(breakpoint, line) for breakpoint, line in zip(buffer_breakpoint_list, buffer_curr_line_list) if breakpoint['line'] != line]
+        if moves:
+            return True, self.breakpoints.move(moves)
+        return False, []
 
     def goto_file(self, file, line, column):
         # NOTE: Show file in current window > last window > new window
-        window = 0
-        test_window = self.get_window()
-        if not self.get_window_var(test_window, self.VIM_LLDB_WINDOW_KEY):
-            window = test_window
-        else:
-            test_window = self.get_last_window()
-            if not self.get_window_var(test_window, self.VIM_LLDB_WINDOW_KEY):
-                window = test_window
-            else:
-                window_count = self.get_window_count()
-                for test_window in range(1, window_count + 1):
-                    if not self.get_window_var(test_window, self.VIM_LLDB_WINDOW_KEY):
-                        window = test_window
-                        break
+        test_windows = self.call('eval', '[win_getid(), win_getid(winnr("#"))] + map(range(1, winnr("$")), "win_getid(v:val)")')
+        window = next((test_window for test_window in test_windows if test_window and test_window not in self.window_registry), 0)
         if window:
-            self.command(f'{window} wincmd w')
+            self.call('win_gotoid', window)
         else:
             self.command('vnew')
-            window = self.get_window()
 
         # NOTE: Find existing buffer if possible, otherwise edit new buffer
-        buffer = 0
-        buffer_count = self.get_buffer()
-        for test_buffer in range(1, buffer_count + 1):
-            if self.is_buffer_valid(test_buffer):
-                test_file = self.get_buffer_file(test_buffer)
-                if test_file == file:
-                    buffer = test_buffer
-                    break
+        buffer = self.buffer_registry.get(file)
         if buffer:
             self.command(f'buffer {buffer}')
         else:
@@ -255,84 +612,153 @@ class Context:
         self.set_line_column(line, column)
 
     def is_debugger_window(self, name = ''):
-        window = self.get_window()
-        window_name = self.get_window_var(window, self.VIM_LLDB_WINDOW_KEY)
+        window_name = self.window_registry.get(self.get_window())
         return window_name and (name == '' or window_name == name)
 
     def check_window_exists(self, name = ''):
-        window_count = self.get_window_count()
-        for window in range(1, window_count + 1):
-            window_name = self.get_window_var(window, self.VIM_LLDB_WINDOW_KEY)
-            if window_name:
-                if name == '' or window_name == name:
-                    return window
+        for window, window_name in self.window_registry.items():
+            if name == '' or window_name == name:
+                return window
         return 0
 
     def create_window(self, name):
         window = self.get_window()
-        self.set_window_var(window, '&readonly', 1)
-        self.set_window_var(window, '&modifiable', 0)
-        self.set_window_var(window, '&buftype', 'nofile')
-        self.set_window_var(window, '&buflisted', 0)
-        self.set_window_var(window, '&bufhidden', 'wipe')
-        self.set_window_var(window, '&swapfile', 0)
-        self.set_window_var(window, '&number', 0)
-        self.set_window_var(window, '&ruler', 0)
-        self.set_window_var(window, '&wrap', 0)
-
-        self.command(f'file vim-lldb ({name})')
-        self.set_window_var(window, self.VIM_LLDB_WINDOW_KEY, name)
+        window_vars = [
+            ('&readonly', 1),
+            ('&modifiable', 0),
+            ('&buftype', 'nofile'),
+            ('&buflisted', 0),
+            ('&bufhidden', 'wipe'),
+            ('&swapfile', 0),
+            ('&number', 0),
+            ('&ruler', 0),
+            ('&wrap', 0),
+        ]
+        calls = [['nvim_call_function', ['setwinvar', [window, var, value]]] for var, value in window_vars]
+        calls.append(['nvim_command', [f'file vim-lldb ({name})']])
+        calls.append(['nvim_call_function', ['setwinvar', [window, self.VIM_LLDB_WINDOW_KEY, name]]])
+        self.register_window(window, name)
 
         # NOTE: We can use <nowait> in the future if we want to map 'd' into a shortcut
         if name == 'stack':
-            self.command('nnoremap <buffer> <CR> :call VimLLDB_StackWindow_GotoFrame()<CR>')
-            self.command('nnoremap <buffer> <C-n> :call VimLLDB_StackWindow_NextThread()<CR>')
-            self.command('nnoremap <buffer> <C-p> :call VimLLDB_StackWindow_PrevThread()<CR>')
+            mappings = [
+                '<CR> :call VimLLDB_StackWindow_GotoFrame()<CR>',
+                '<C-n> :call VimLLDB_StackWindow_NextThread()<CR>',
+                '<C-p> :call VimLLDB_StackWindow_PrevThread()<CR>',
+            ]
         elif name == 'breakpoint':
-            self.command('nnoremap <buffer> <CR> :call VimLLDB_BreakpointWindow_GotoBreakpoint()<CR>')
-            self.command('nnoremap <buffer> md :call VimLLDB_BreakpointWindow_RemoveBreakpoint()<CR>')
+            mappings = [
+                '<CR> :call VimLLDB_BreakpointWindow_GotoBreakpoint()<CR>',
+                'md :call VimLLDB_BreakpointWindow_RemoveBreakpoint()<CR>',
+                'mc :call VimLLDB_BreakpointWindow_ChangeCondition()<CR>',
+                'mi :call VimLLDB_BreakpointWindow_ChangeIgnoreCount()<CR>',
+                'mt :call VimLLDB_BreakpointWindow_ChangeThread()<CR>',
+                'ml :call VimLLDB_BreakpointWindow_ChangeLog()<CR>',
+            ]
         elif name == 'watch':
-            self.command('nnoremap <buffer> ma :call VimLLDB_WatchWindow_AddWatch()<CR>')
-            self.command('nnoremap <buffer> mm :call VimLLDB_WatchWindow_ChangeWatch()<CR>')
-            self.command('nnoremap <buffer> md :call VimLLDB_WatchWindow_RemoveWatch()<CR>')
-            self.command('nnoremap <buffer> o :call VimLLDB_WatchWindow_ExpandWatch()<CR>')
-            self.command('nnoremap <buffer> x :call VimLLDB_WatchWindow_CollapseWatch()<CR>')
+            mappings = [
+                'ma :call VimLLDB_WatchWindow_AddWatch()<CR>',
+                'mm :call VimLLDB_WatchWindow_ChangeWatch()<CR>',
+                'md :call VimLLDB_WatchWindow_RemoveWatch()<CR>',
+                'o :call VimLLDB_WatchWindow_ExpandWatch()<CR>',
+                'x :call VimLLDB_WatchWindow_CollapseWatch()<CR>',
+            ]
         elif name == 'output':
-            self.command('nnoremap <buffer> <C-n> :call VimLLDB_OutputWindow_NextStream()<CR>')
-            self.command('nnoremap <buffer> <C-p> :call VimLLDB_OutputWindow_PrevStream()<CR>')
+            mappings = [
+                '<C-n> :call VimLLDB_OutputWindow_NextStream()<CR>',
+                '<C-p> :call VimLLDB_OutputWindow_PrevStream()<CR>',
+            ]
+        else:
+            mappings = []
+        for mapping in mappings:
+            calls.append(['nvim_command', [f'nnoremap <buffer> {mapping}']])
+
+        self.call_atomic(calls)
 
     def destory_window(self, name = ''):
-        while True:
-            window_count = self.get_window_count()
-            for window in range(1, window_count + 1):
-                window_name = self.get_window_var(window, self.VIM_LLDB_WINDOW_KEY)
-                if window_name and (name == '' or window_name == name):
-                    if window_count > 1:
-                        self.command(f'{window}quit!')
-                    else:
-                        self.command(f'enew!')
-                    break
-            if window_count == 1:
-                break
+        for window, window_name in list(self.window_registry.items()):
+            if name == '' or window_name == name:
+                if self.get_window_count() > 1:
+                    self.nvim.api.win_close(window, True)
+                else:
+                    self.call_atomic([
+                        ['nvim_command', ['enew!']],
+                        # NOTE: A split debugger window doesn't have the window variable
+                        ['nvim_command', [f'unlet! w:{self.VIM_LLDB_WINDOW_KEY}']],
+                    ])
+                self.unregister_window(window)
+
+    # NOTE: All debugger window are non-modifiable. Wrap calls that write a debugger window buffer so that they run in a temporary modifiable environment within one atomic call, which doesn't navigate to the window so we don't see a flash of cursor change.
+    # The view of the current window is saved and restored around the write in case the current window is the debugger window itself
+    def writing_calls(self, buffer, calls):
+        return [
+            ['nvim_command', ['let w:vim_lldb_saved_view = winsaveview()']],
+            ['nvim_buf_set_option', [buffer, 'readonly', False]],
+            ['nvim_buf_set_option', [buffer, 'modifiable', True]],
+            *calls,
+            ['nvim_buf_set_option', [buffer, 'readonly', True]],
+            ['nvim_buf_set_option', [buffer, 'modifiable', False]],
+            ['nvim_buf_set_option', [buffer, 'modified', False]],
+            ['nvim_command', ['call winrestview(w:vim_lldb_saved_view) | unlet w:vim_lldb_saved_view']],
+        ]
+
+    def get_output_window_header(self):
+        header = f'process output {self.selected_stream}'
+        if self.target_progress:
+            header += f'  ({self.target_progress})'
+        return header
+
+    # NOTE: Rewrite only the header line of the output window, e.g. for target loading progress
+    def update_output_window_header(self):
+        window = self.check_window_exists('output')
+        rendered = self.window_lines.get('output')
+        if window and rendered:
+            buffer = self.get_window_buffer(window)
+            if rendered['buffer'] == buffer:
+                header = self.get_output_window_header()
+                rendered['lines'][0] = { 'text': header }
+                self.call_atomic(self.writing_calls(buffer, [['nvim_buf_set_lines', [buffer, 0, 1, False, [header]]]]))
 
     def update_window(self, name):
         def get_output_window_lines():
-            lines = [ { 'text': f'process output {self.selected_stream}' }, { 'text': '' } ]
-            for text in self.process_output[self.selected_stream].splitlines():
+            lines = [ { 'text': self.get_output_window_header() }, { 'text': '' } ]
+            complete_lines, partial_line = split_output_lines(self.get_output_log(self.selected_stream).get_text(self.selected_stream))
+            for text in complete_lines:
                 lines.append({'text': text })
+            if partial_line:
+                lines.append({'text': partial_line })
+            self.output_window_tail = partial_line
+            self.output_window_appended = 0
             return lines
 
         def get_breakpoint_window_lines():
             lines = []
-            for breakpoint in self.breakpoint_list:
-                lines.append({'text': f'{breakpoint["file"]}:{breakpoint["line"]}' })
+            unresolved_count = 0
+            for breakpoint in self.breakpoints:
+                line = {'text': f'{breakpoint["file"]}:{breakpoint["line"]}', 'breakpoint': breakpoint }
+                if breakpoint['condition']:
+                    line['text'] += f'  if {breakpoint["condition"]}'
+                if breakpoint['ignore_count']:
+                    line['text'] += f'  ignore {breakpoint["ignore_count"]}'
+                if breakpoint['thread'] is not None:
+                    line['text'] += f'  thread {breakpoint["thread"]}'
+                if breakpoint['log']:
+                    line['text'] += f'  log {breakpoint["log"]}'
+                if breakpoint['locations'] == 0:
+                    line['text'] += '  (unresolved)'
+                    line['highlight'] = 'invalid'
+                    unresolved_count += 1
+                lines.append(line)
+            if unresolved_count:
+                lines.append({ 'text': '' })
+                lines.append({ 'text': f'{unresolved_count} of {len(self.breakpoints)} breakpoints unresolved' })
             return lines
 
         def get_stack_window_lines():
             lines = []
             if self.process_info['state'] == 'stopped':
                 selected_frame_info = self.get_selected_frame_info()
-                for line, frame_info in enumerate(self.selected_thread_info['frames'], start=1):
+                for line, frame_info in enumerate(self.unwind_thread(self.selected_thread_info), start=1):
                     if frame_info['type'] == 'full':
                         line = { 'text': f'{frame_info["function"]}  ({frame_info["file"]}:{frame_info["line"]})' }
                         if frame_info == selected_frame_info:
@@ -346,47 +772,41 @@ class Context:
                 lines.append({ 'text': f'process {self.process_info["state"]}' })
             return lines
 
+        # NOTE: Each line carries the watch it shows, so that the watch under the cursor is looked up by line number
         def get_watch_window_lines():
             lines = []
             def add_watch_list_lines(watch_list, depth):
                 indent = '  ' * depth
                 for watch in watch_list:
-                    if self.process_info['state'] == 'stopped':
+                    if watch.get('more'):
+                        lines.append({ 'text': f'{indent}...  more', 'highlight': 'invalid', 'watch': watch })
+                    elif self.process_info['state'] == 'stopped':
+                        line_index = len(lines)
                         if watch['value'].IsValid():
                             summary = watch['value'].GetSummary()
                             value = watch['value'].GetValue()
                             if watch['value'].MightHaveChildren():
                                 summary = f'  {summary}' if summary else (f'  {value}' if value else '')
                                 if watch['children']:
-                                    lines.append({ 'text': f'{indent}{watch["expr"]}{summary}' })
+                                    lines.append({ 'text': f'{indent}{watch["expr"]}{summary}', 'watch': watch })
                                     add_watch_list_lines(watch['children'], depth + 1)
                                 else:
-                                    lines.append({ 'text': f'{indent}{watch["expr"]}{summary}  ...' })
+                                    lines.append({ 'text': f'{indent}{watch["expr"]}{summary}  ...', 'watch': watch })
                             else:
-                                lines.append({ 'text': f'{indent}{watch["expr"]}  {value}' })
+                                lines.append({ 'text': f'{indent}{watch["expr"]}  {value}', 'watch': watch })
                         else:
-                            lines.append({ 'text': f'{indent}{watch["expr"]}' })
+                            lines.append({ 'text': f'{indent}{watch["expr"]}', 'watch': watch })
+                        # NOTE: Mark watches evaluated in the background that are pending, timed out or slow
+                        if watch.get('status'):
+                            if watch['status'] not in ('pending', 'timeout'):
+                                lines[line_index]['text'] += f'  ({watch["status"]})'
+                            lines[line_index]['highlight'] = 'invalid'
                     else:
-                        lines.append({ 'text': f'{indent}{watch["expr"]}' })
+                        lines.append({ 'text': f'{indent}{watch["expr"]}', 'watch': watch })
                         add_watch_list_lines(watch['children'], depth + 1)
             add_watch_list_lines(self.watch_list, 0)
             return lines
 
-        # NOTE: All debugger window are non-modifiable. Modify the window through a temporary modifiable environment
-        @contextmanager
-        def writing(window):
-            saved_line = self.get_line()
-            saved_column = self.get_column()
-
-            self.set_window_var(window, '&readonly', 0)
-            self.set_window_var(window, '&modifiable', 1)
-            yield
-            self.set_window_var(window, '&readonly', 1)
-            self.set_window_var(window, '&modifiable', 0)
-            self.set_window_var(window, '&modified', 0)
-
-            self.set_line_column(saved_line, saved_column)
-
         window = self.check_window_exists(name)
         if window:
             if name == 'stack':
@@ -398,46 +818,84 @@ class Context:
             elif name == 'output':
                 lines = get_output_window_lines()
 
-            window_matches = self.get_window_var(window, self.VIM_LLDB_WINDOW_MATCH)
-            if window_matches:
-                for match in window_matches:
-                    self.call('matchdelete', match, window)
-            window_matches = []
-
-            with writing(window):
-                # NOTE: We use deletebufline and setbufline instead of navigating to the window so that we don't see a flash of cursor change
-                buffer = self.call('winbufnr', window)
-                self.call('deletebufline', buffer, 1, '$')
-                for line_index, line in enumerate(lines, start=1):
-                    self.call('setbufline', buffer, line_index, line['text'])
-                    if 'highlight' in line:
-                        highlight_dictionary = {
-                            'invalid': 'Comment'
-                        }
-                        # TODO: Add this code when matchdelete works
-                        # match_id = self.call('matchaddpos', highlight_dictionary[line['highlight']], [line_index], -1, -1, { 'window': window })
-                        # window_matches.append(match_id)
-
-            self.set_window_var(window, self.VIM_LLDB_WINDOW_MATCH, window_matches)
+            highlight_dictionary = {
+                'invalid': 'Comment'
+            }
+
+            # NOTE: A Neovim buffer always has at least one line, keep the rendered lines in the same shape so that diffs line up with the buffer
+            if not lines:
+                lines = [{ 'text': '' }]
+
+            # NOTE: Compare with the last rendered lines of the same buffer. A new buffer (e.g. debugger toggled) is rendered in full
+            buffer = self.get_window_buffer(window)
+            if name in self.window_lines and self.window_lines[name]['buffer'] == buffer:
+                rendered_lines = self.window_lines[name]['lines']
+                # NOTE: Full renders of the output window follow a stream switch or evicted output, where nearly every line moves, so the changed middle is never matched line by line
+                hunks = diff_lines([(line['text'], line.get('highlight')) for line in rendered_lines], [(line['text'], line.get('highlight')) for line in lines], 0 if name == 'output' else DIFF_MATCH_LIMIT)
+            else:
+                hunks = [(0, -1, 0, len(lines))]
+            self.window_lines[name] = { 'buffer': buffer, 'lines': lines }
+
+            if hunks:
+                calls = []
+                # NOTE: Apply hunks from bottom to top so that the line numbers of earlier hunks stay valid. Highlights on replaced lines are cleared first, otherwise they would move onto the new lines
+                for old_start, old_end, new_start, new_end in reversed(hunks):
+                    calls.append(['nvim_buf_clear_namespace', [buffer, self.window_highlight_namespace, old_start, old_end]])
+                    calls.append(['nvim_buf_set_lines', [buffer, old_start, old_end, False, [line['text'] for line in lines[new_start:new_end]]]])
+                for old_start, old_end, new_start, new_end in hunks:
+                    for line_index in range(new_start, new_end):
+                        if 'highlight' in lines[line_index]:
+                            calls.append(['nvim_buf_add_highlight', [buffer, self.window_highlight_namespace, highlight_dictionary[lines[line_index]['highlight']], line_index, 0, -1]])
+                self.call_atomic(self.writing_calls(buffer, calls))
+
+    # NOTE: Append new output to the end of the output window instead of rendering the whole output again, the last partial line is completed in place.
+    # Once more than the output limit has been appended, we render in full so that the buffer doesn't keep output that the log has already evicted
+    def append_output_window(self, output):
+        if output:
+            window = self.check_window_exists('output')
+            if window:
+                buffer = self.get_window_buffer(window)
+                rendered = self.window_lines.get('output')
+                self.output_window_appended += len(output)
+                if not rendered or rendered['buffer'] != buffer or self.output_window_appended > self.get_output_log(self.selected_stream).limit:
+                    self.update_window('output')
+                    return
+
+                complete_lines, partial_line = split_output_lines(self.output_window_tail + output)
+                new_lines = [{ 'text': text } for text in complete_lines]
+                if partial_line:
+                    new_lines.append({ 'text': partial_line })
+                start = len(rendered['lines']) - 1 if self.output_window_tail else len(rendered['lines'])
+                rendered['lines'][start:] = new_lines
+                self.output_window_tail = partial_line
+
+                calls = self.writing_calls(buffer, [['nvim_buf_set_lines', [buffer, start, -1, False, [line['text'] for line in new_lines]]]])
+                # NOTE: Follow the tail by moving the cursor of the output window only, the user's cursor stays where it is. If the user is in the output window, we leave it alone
+                if self.output_follow and window != self.get_window():
+                    calls.append(['nvim_command', [f"call win_execute({window}, 'normal! G')"]])
+                self.call_atomic(calls)
 
     # NOTE: Lock all potential cpp files as non-modifiable when the process runs, so that we don't get into situations like breakpoint and cursor signs don't match their source code line
     def lock_files(self):
-        window_count = self.get_window_count()
-        for window in range(1, window_count + 1):
-            buffer = self.get_window_buffer(window)
-            if re.compile(r'.*\.(c|cpp|cxx|h|hpp|hxx)$').match(self.get_buffer_file(buffer)):
-                self.set_window_var(window, '&readonly', 1)
-                self.set_window_var(window, '&modifiable', 0)
-                self.set_window_var(window, self.VIM_LLDB_WINDOW_LOCK, 1)
+        calls = []
+        for window_info in self.call('getwininfo'):
+            file = self.buffer_files.get(window_info['bufnr'])
+            if file and re.compile(r'.*\.(c|cpp|cxx|h|hpp|hxx)$').match(file):
+                calls.append(['nvim_call_function', ['setwinvar', [window_info['winid'], '&readonly', 1]]])
+                calls.append(['nvim_call_function', ['setwinvar', [window_info['winid'], '&modifiable', 0]]])
+                self.locked_windows.add(window_info['winid'])
+        if calls:
+            self.call_atomic(calls)
 
     def unlock_files(self):
-        window_count = self.get_window_count()
-        for window in range(1, window_count + 1):
-            if self.get_window_var(window, self.VIM_LLDB_WINDOW_LOCK):
-                self.set_window_var(window, '&readonly', 0)
-                self.set_window_var(window, '&modifiable', 1)
-                self.set_window_var(window, self.VIM_LLDB_WINDOW_LOCK, 0)
-                
+        calls = []
+        for window in self.locked_windows:
+            calls.append(['nvim_call_function', ['setwinvar', [window, '&readonly', 0]]])
+            calls.append(['nvim_call_function', ['setwinvar', [window, '&modifiable', 1]]])
+        self.locked_windows.clear()
+        if calls:
+            self.call_atomic(calls)
+
     def select_target(self, selection = 0):
         # NOTE: Load target definitions when we select target so that we don't need a separate funtion to refresh target definitions 
         if self.call('exists', 'g:vim_lldb_targets'):
@@ -466,6 +924,10 @@ class Context:
         else:
             self.log_error('Invalid target selection')
 
+        # NOTE: Start loading the selected target in the background. We don't replace the target under a live process
+        if self.selected_target and self.process_info['state'] == 'exited':
+            self.preload_target(self.selected_target['executable'])
+
     def toggle_debugger(self):
         if not self.is_debugger_toggling:
             self.is_debugger_toggling = True
@@ -492,52 +954,190 @@ class Context:
                     self.create_window('stack')
                     self.update_window('stack')
 
-                    self.command(f'{window} wincmd w')
+                    self.call('win_gotoid', window)
             else:
                 self.log_error('No target selected')
             self.is_debugger_toggling = False
 
-    def launch(self):
-        if self.selected_target:
-            if self.process_info['state'] == 'exited':
-                executable = self.selected_target['executable']
-                arguments = self.selected_target['arguments']
-                working_dir = self.selected_target['working_dir']
-                environments = self.selected_target['environments']
-
-                # NOTE: We simplify the breakpoint states by creating a new target (no breakpoint) every time we launch, and creating all breakpoints
-                if 'handle' in self.selected_target and self.selected_target['handle']:
-                    self.debugger.DeleteTarget(self.selected_target['handle'])
-                self.selected_target['handle'] = self.debugger.CreateTargetWithFileAndTargetTriple(executable, 'x86_64-unknown-linux-gnu')
-
-                for breakpoint in self.breakpoint_list:
-                    target_breakpoint = self.selected_target['handle'].BreakpointCreateByLocation(breakpoint['file'], breakpoint['line'])
+    # NOTE: Reuse the target of the executable while the executable file is unchanged (same mtime and size), so that the executable and its debug info are not parsed again on every launch.
+    # Target creation and debug info indexing run in a background thread. The future of that work is kept in the target cache, so a launch continues when the same work is done instead of starting it again
+    def preload_target(self, executable):
+        path = os.path.abspath(executable)
+        self.preloading_path = path
+        try:
+            stat = os.stat(path)
+        except OSError as error:
+            self.log_error(f'Cannot access executable: {error}')
+            return None
+        signature = (stat.st_mtime_ns, stat.st_size)
+
+        cached_target = self.target_cache.get(path)
+        if cached_target and cached_target['signature'] == signature:
+            future = cached_target['future']
+            if not future.done() or (future.result() and future.result().IsValid()):
+                return future
+
+        # NOTE: Frames of the target in use (the one breakpoints were synced to) are cached, they are cleared once its replacement is loaded
+        is_replacing_target_in_use = False
+        if cached_target:
+            old_future = cached_target['future']
+            is_replacing_target_in_use = old_future.done() and old_future.result() is not None and old_future.result() == self.breakpoint_target
+            old_future.add_done_callback(self.delete_target)
+        future = concurrent.futures.Future()
+        self.target_cache[path] = { 'future': future, 'signature': signature }
+        threading.Thread(target=self.load_target, args=(executable, path, future, is_replacing_target_in_use), daemon=True).start()
+        return future
+
+    def delete_target(self, future):
+        target = future.result()
+        if target:
+            self.debugger.DeleteTarget(target)
+
+    # NOTE: Runs in the background thread. Looking up a name in each module forces its symbol table and debug info index to be built, which is what breakpoint resolution and the first stop would wait for otherwise
+    def load_target(self, executable, path, future, is_replacing_target_in_use):
+        target = None
+        try:
+            self.update_target_progress(f'loading {os.path.basename(executable)}')
+            target = self.debugger.CreateTargetWithFileAndTargetTriple(executable, 'x86_64-unknown-linux-gnu')
+            if target.IsValid():
+                module_count = target.GetNumModules()
+                for index in range(module_count):
+                    # NOTE: Another executable was selected, leave the rest to be indexed on demand
+                    if self.preloading_path != path:
+                        break
+                    module = target.GetModuleAtIndex(index)
+                    self.update_target_progress(f'indexing {module.GetFileSpec().GetFilename()} {index + 1}/{module_count}')
+                    module.GetNumCompileUnits()
+                    module.FindFunctions('main', lldb.eFunctionNameTypeAuto)
+                if is_replacing_target_in_use:
+                    self.clear_frame_cache()
+            else:
+                target = None
+                self.log_error('Cannot create target')
+        except Exception:
+            target = None
+            self.log_error(traceback.format_exc())
+        finally:
+            self.update_target_progress('')
+            future.set_result(target)
+
+    @neovim_thread(coalesce='target_progress')
+    def update_target_progress(self, progress):
+        self.target_progress = progress
+        self.update_output_window_header()
+
+    # NOTE: Conditions, ignore counts and thread filters are evaluated by LLDB itself, so the process doesn't stop and the event loop isn't notified until the breakpoint really fires.
+    # The thread filter is the thread index id shown in the stack window, which is stable across launches for the main thread unlike the system thread id
+    def apply_breakpoint_options(self, target_breakpoint, breakpoint):
+        target_breakpoint.SetCondition(breakpoint['condition'])
+        target_breakpoint.SetIgnoreCount(breakpoint['ignore_count'])
+        target_breakpoint.SetThreadIndex(breakpoint['thread'] if breakpoint['thread'] is not None else lldb.UINT32_MAX)
+
+    # NOTE: Bring the breakpoints of the target up to date with the breakpoint store. Breakpoints created for the same line are kept, moved breakpoints are created again and breakpoints removed from the store are deleted.
+    # Missing breakpoints are created per file sharing one file spec, and breakpoints that cannot be created are reported once in total. They are not restricted to modules, so that they also resolve in modules loaded at runtime
+    def sync_target_breakpoints(self, target):
+        if self.breakpoint_target is None or self.breakpoint_target != target:
+            for breakpoint in self.breakpoints:
+                self.breakpoints.set_id(breakpoint, None)
+            self.breakpoint_target = target
+
+        target_breakpoint_ids = [target.GetBreakpointAtIndex(index).GetID() for index in range(target.GetNumBreakpoints())]
+        for target_breakpoint_id in target_breakpoint_ids:
+            breakpoint = self.breakpoints.find_by_id(target_breakpoint_id)
+            if not breakpoint or breakpoint['target_line'] != breakpoint['line']:
+                target.BreakpointDelete(target_breakpoint_id)
+                if breakpoint:
+                    self.breakpoints.set_id(breakpoint, None)
+
+        # NOTE: Options are applied to kept breakpoints as well, since LLDB consumes the ignore count as the breakpoint is hit
+        failed_count = 0
+        for file, file_breakpoints in self.breakpoints.file_index.items():
+            file_spec = None
+            for line, breakpoint in sorted(file_breakpoints.items()):
+                target_breakpoint = target.FindBreakpointByID(breakpoint['id']) if breakpoint['id'] is not None else None
+                if not target_breakpoint or not target_breakpoint.IsValid():
+                    if file_spec is None:
+                        file_spec = lldb.SBFileSpec(file, False)
+                    target_breakpoint = target.BreakpointCreateByLocation(file_spec, line)
                     if target_breakpoint.IsValid():
-                        breakpoint['id'] = target_breakpoint.GetID()
+                        self.breakpoints.set_id(breakpoint, target_breakpoint.GetID())
                     else:
-                        self.log_error('Cannot create breakpoint')
+                        self.breakpoints.set_id(breakpoint, None)
+                        failed_count += 1
+                        continue
+                self.apply_breakpoint_options(target_breakpoint, breakpoint)
+        if failed_count:
+            self.log_error(f'Cannot create {failed_count} breakpoints')
 
-                launch_info = lldb.SBLaunchInfo([])
-                launch_info.SetExecutableFile(lldb.SBFileSpec(executable), True)
-                launch_info.SetArguments(arguments, True)
-                launch_info.SetEnvironmentEntries(environments, True)
-                launch_info.SetWorkingDirectory(working_dir)
-                launch_info.SetLaunchFlags(0)
-                error = lldb.SBError()
-                process = self.selected_target['handle'].Launch(launch_info, error)
-                if error.Success():
-                    self.lock_files()
-                    self.process_output['both'] = ''
-                    self.process_output['stdout'] = ''
-                    self.process_output['stderr'] = ''
-                    self.update_window('output')
-                else:
-                    self.log_error(error.GetCString())
+        self.update_logpoints()
+
+        self.refresh_breakpoint_locations(target)
+
+    # NOTE: Update the number of resolved locations of each breakpoint, which changes as modules are loaded. Returns whether any breakpoint changed
+    def refresh_breakpoint_locations(self, target):
+        has_change = False
+        for breakpoint in self.breakpoints:
+            locations = None
+            if breakpoint['id'] is not None:
+                target_breakpoint = target.FindBreakpointByID(breakpoint['id'])
+                if target_breakpoint.IsValid():
+                    locations = target_breakpoint.GetNumLocations()
+            if breakpoint['locations'] != locations:
+                breakpoint['locations'] = locations
+                has_change = True
+        return has_change
+
+    # NOTE: The launch continues in launch_target once the target is loaded, so the Neovim thread never waits for loading
+    def launch(self):
+        if self.selected_target:
+            if self.process_info['state'] == 'exited':
+                if self.launching_target:
+                    self.log_error('Target is loading for launch')
+                    return
+                future = self.preload_target(self.selected_target['executable'])
+                if future:
+                    self.launching_target = self.selected_target
+                    future.add_done_callback(self.launch_target)
             else:
                 self.log_error('Cannot launch process from non-exited state')
         else:
             self.log_error('No target selected')
 
+    @neovim_thread()
+    def launch_target(self, future):
+        selected_target = self.launching_target
+        self.launching_target = None
+        target = future.result()
+        # NOTE: Give up if the target failed to load (errors are logged by load_target), or the selection or the process changed while loading
+        if not target or selected_target is not self.selected_target or self.process_info['state'] != 'exited':
+            return
+
+        executable = selected_target['executable']
+        arguments = selected_target['arguments']
+        working_dir = selected_target['working_dir']
+        environments = selected_target['environments']
+
+        selected_target['handle'] = target
+        self.clear_source_file_cache()
+        self.sync_target_breakpoints(target)
+        self.update_window('breakpoint')
+
+        launch_info = lldb.SBLaunchInfo([])
+        launch_info.SetExecutableFile(lldb.SBFileSpec(executable), True)
+        launch_info.SetArguments(arguments, True)
+        launch_info.SetEnvironmentEntries(environments, True)
+        launch_info.SetWorkingDirectory(working_dir)
+        launch_info.SetLaunchFlags(0)
+        error = lldb.SBError()
+        process = target.Launch(launch_info, error)
+        if error.Success():
+            self.lock_files()
+            self.process_output.clear()
+            self.log_output.clear()
+            self.update_window('output')
+        else:
+            self.log_error(error.GetCString())
+
     def step_over(self):
         if self.selected_target:
             if self.process_info['state'] == 'stopped':
@@ -607,70 +1207,153 @@ class Context:
         else:
             self.log_error('No target selected')
 
-    def update_process_cursor(self):
-        cursor_list_selected = []
-        cursor_list_not_selected = []
+    def get_process_cursor_sign_index(self):
+        cursor_index_selected = {}
+        cursor_index_not_selected = {}
         if self.process_info['state'] == 'stopped':
             selected_frame_info = self.get_selected_frame_info()
-            for frame_info in self.selected_thread_info['frames']:
+            for frame_info in self.unwind_thread(self.selected_thread_info):
                 if frame_info['type'] == 'full':
-                    cursor_list = cursor_list_selected if frame_info == selected_frame_info else cursor_list_not_selected
-                    cursor_list.append({ 'file': frame_info['file'], 'line': frame_info['line'] })
-        self.sync_signs(self.VIM_LLDB_SIGN_CURSOR_SELECTED, cursor_list_selected)
-        self.sync_signs(self.VIM_LLDB_SIGN_CURSOR_NOT_SELECTED, cursor_list_not_selected)
+                    cursor_index = cursor_index_selected if frame_info == selected_frame_info else cursor_index_not_selected
+                    cursor_index.setdefault(frame_info['file'], set()).add(frame_info['line'])
+        return { self.VIM_LLDB_SIGN_CURSOR_SELECTED: cursor_index_selected, self.VIM_LLDB_SIGN_CURSOR_NOT_SELECTED: cursor_index_not_selected }
+
+    def update_process_cursor(self):
+        self.sync_signs(self.get_process_cursor_sign_index())
+
+    # NOTE: Remove a breakpoint from memory, and from the target when the process is alive. Returns whether the breakpoint is removed
+    def remove_breakpoint(self, breakpoint):
+        if self.process_info['state'] == 'exited' or breakpoint['id'] is None:
+            self.breakpoints.remove(breakpoint)
+            self.update_logpoints()
+            return True
+        else:
+            if self.selected_target['handle'].BreakpointDelete(breakpoint['id']):
+                self.breakpoints.remove(breakpoint)
+                self.update_logpoints()
+                return True
+            else:
+                self.log_error('Cannot remove breakpoint')
+                return False
 
     def toggle_breakpoint(self):
         if self.selected_target:
             file = self.get_buffer_file()
             line = self.get_line()
 
-            curr_breakpoint = None
-            for breakpoint in self.breakpoint_list:
-                if breakpoint['file'] == file and breakpoint['line'] == line:
-                    curr_breakpoint = breakpoint
-                    break
-
+            curr_breakpoint = self.breakpoints.find(file, line)
             if curr_breakpoint:
-                if self.process_info['state'] == 'exited':
-                    self.breakpoint_list.remove(curr_breakpoint)
-                else:
-                    if self.selected_target['handle'].BreakpointDelete(curr_breakpoint['id']):
-                        self.breakpoint_list.remove(curr_breakpoint)
-                    else:
-                        self.log_error('Cannot remove breakpoint')
+                self.remove_breakpoint(curr_breakpoint)
             else:
                 if self.process_info['state'] == 'exited':
-                    self.breakpoint_list.append({ 'file': file, 'line': line, 'id': None })
+                    self.breakpoints.add(file, line)
                 else:
-                    breakpoint = self.selected_target['handle'].BreakpointCreateByLocation(file, line)
-                    if breakpoint.IsValid():
-                        self.breakpoint_list.append({ 'file': file, 'line': line, 'id': breakpoint.GetID() })
+                    target = self.selected_target['handle']
+                    target_breakpoint = target.BreakpointCreateByLocation(file, line)
+                    if target_breakpoint.IsValid():
+                        breakpoint = self.breakpoints.add(file, line, target_breakpoint.GetID())
+                        breakpoint['locations'] = target_breakpoint.GetNumLocations()
+                        self.apply_breakpoint_options(target_breakpoint, breakpoint)
                     else:
                         self.log_error('Cannot create breakpoint')
 
             self.update_window('breakpoint')
-            self.sync_signs(self.VIM_LLDB_SIGN_BREAKPOINT, self.breakpoint_list)
+            self.sync_breakpoint_signs()
         else:
             self.log_error('No target selected')
 
+    # NOTE: Install the sync back autocmds on buffers that have breakpoints and remove them from buffers that don't. Nothing is sent when the set of buffers doesn't change.
+    # Sync back happens when text is changed in normal mode and when leaving insert mode, not on every keystroke in insert mode. Debugger window buffers never have breakpoints, so they never sync back
+    def update_sync_back_autocmds(self):
+        buffers = set(self.buffer_registry[file] for file in self.breakpoints.file_index if file in self.buffer_registry)
+        calls = []
+        for buffer in self.sync_back_buffers - buffers:
+            calls.append(['nvim_command', [f'autocmd! {self.VIM_LLDB_SYNC_BACK_GROUP} * <buffer={buffer}>']])
+        for buffer in buffers - self.sync_back_buffers:
+            calls.append(['nvim_command', [f'autocmd! {self.VIM_LLDB_SYNC_BACK_GROUP} * <buffer={buffer}>']])
+            calls.append(['nvim_command', [f'autocmd {self.VIM_LLDB_SYNC_BACK_GROUP} TextChanged,InsertLeave <buffer={buffer}> call VimLLDB_BufferSyncBack({buffer})']])
+        self.sync_back_buffers = buffers
+        if calls:
+            self.call_atomic(calls)
+
+    def sync_breakpoint_signs(self):
+        self.sync_signs({ self.VIM_LLDB_SIGN_BREAKPOINT: self.breakpoints.file_index })
+        self.update_sync_back_autocmds()
+
     def buffer_sync(self):
         if not self.is_debugger_window():
-            self.sync_signs(self.VIM_LLDB_SIGN_BREAKPOINT, self.breakpoint_list)
-            self.update_process_cursor()
+            self.sync_signs({ self.VIM_LLDB_SIGN_BREAKPOINT: self.breakpoints.file_index, **self.get_process_cursor_sign_index() })
+            self.update_sync_back_autocmds()
             if self.process_info['state'] != 'exited':
                 self.lock_files()
 
-    def buffer_sync_back(self):
-        # NOTE: We don't want to sync back breakpoint window, otherwise update_window will keep triggerring buffer_sync_back, causing a dead loop
-        if not self.is_debugger_window():
-            if self.sync_back_signs(self.VIM_LLDB_SIGN_BREAKPOINT, self.breakpoint_list):
-                self.update_window('breakpoint')
+    def buffer_sync_back(self, buffer):
+        has_change, duplicates = self.sync_back_signs(buffer)
+        # NOTE: Breakpoints squashed onto the same line by deleting text are merged
+        for breakpoint in duplicates:
+            self.remove_breakpoint(breakpoint)
+        if duplicates:
+            self.sync_breakpoint_signs()
+        if has_change:
+            self.update_window('breakpoint')
+
+    # NOTE: Called from the event loop and target loading threads as well, the cache is cleared on the Neovim thread in order with the other dispatched calls
+    @neovim_thread(coalesce='frame_cache')
+    def clear_frame_cache(self):
+        self.frame_cache.clear()
+
+    def clear_source_file_cache(self):
+        self.source_file_cache.clear()
+
+    # NOTE: Symbolication of a caller frame uses its return address, so the same PC can resolve differently in the top frame and the frames it's inlined into (is_top).
+    # Inlined frames share the PC of the frame they are inlined into, so they are told apart by their block
+    def get_frame_info(self, frame, is_top):
+        module = frame.GetModule()
+        block_address = frame.GetFrameBlock().GetRangeStartAddress(0).GetFileAddress()
+        key = (module.GetUUIDString(), frame.GetPC(), is_top, frame.IsInlined(), block_address)
+        frame_record = self.frame_cache.get(key)
+        if not frame_record:
+            frame_record = {}
+            frame_record['module'] = module.GetFileSpec().fullpath or ''
+            frame_record['function'] = frame.GetDisplayFunctionName() or ''
+            frame_record['type'] = 'full' if frame.GetFunction().IsValid() else 'none'
+            if frame_record['type'] == 'full':
+                line_entry = frame.GetLineEntry()
+                frame_record['file'] = line_entry.GetFileSpec().fullpath or ''
+                frame_record['line'] = line_entry.GetLine()
+                frame_record['column'] = line_entry.GetColumn()
+            self.frame_cache[key] = frame_record
+
+        frame_info = dict(frame_record)
+        frame_info['handle'] = frame
+        if frame_info['type'] == 'full':
+            file_exists = self.source_file_cache.get(frame_info['file'])
+            if file_exists is None:
+                file_exists = os.path.isfile(frame_info['file'])
+                self.source_file_cache[frame_info['file']] = file_exists
+            if not file_exists:
+                frame_info['type'] = 'partial'
+        return frame_info
+
+    # NOTE: Frames of a thread are unwound on first use, which can be on the event loop thread (stopped thread, eager or background unwinding) or on the Neovim thread (thread selection).
+    # The selected frame of a thread starts at its top frame with debugging info
+    def unwind_thread(self, thread_info):
+        with self.unwind_lock:
+            if thread_info['frames'] is None:
+                frames = []
+                is_top = True
+                for frame in thread_info['handle']:
+                    frames.append(self.get_frame_info(frame, is_top))
+                    # NOTE: The top frame and the frames it's inlined into are at the top PC, the first concrete frame ends them
+                    is_top = is_top and frame.IsInlined()
+                thread_info['selected_frame'] = next((frame_info for frame_info in frames if frame_info['type'] == 'full'), None)
+                thread_info['frames'] = frames
+        return thread_info['frames']
 
     def get_selected_frame_info(self):
         if self.selected_thread_info:
-            selected_thread_index = self.process_info['threads'].index(self.selected_thread_info)
-            selected_frame_info = self.selected_frame_info_list[selected_thread_index]
-            return selected_frame_info
+            self.unwind_thread(self.selected_thread_info)
+            return self.selected_thread_info['selected_frame']
         return None
 
     def goto_selected_frame(self):
@@ -681,11 +1364,11 @@ class Context:
     def stack_window_goto_frame(self):
         if self.process_info['state'] == 'stopped':
             frame_index = self.get_line() - 1
-            frame_info = self.selected_thread_info['frames'][frame_index]
+            frame_info = self.unwind_thread(self.selected_thread_info)[frame_index]
             if frame_info['type'] == 'full':
                 selected_frame_info = self.get_selected_frame_info()
                 if selected_frame_info != frame_info:
-                    list_replace(self.selected_frame_info_list, selected_frame_info, frame_info)
+                    self.selected_thread_info['selected_frame'] = frame_info
                     self.update_window('stack')
                     self.update_process_cursor()
                     self.reevaluate_watch_list()
@@ -715,35 +1398,98 @@ class Context:
             self.reevaluate_watch_list()
             self.update_window('watch')
 
+    # NOTE: Get the breakpoint on the cursor line of the breakpoint window from its rendered lines
+    def get_breakpoint(self):
+        rendered = self.window_lines.get('breakpoint')
+        line_index = self.get_line() - 1
+        if rendered and line_index < len(rendered['lines']):
+            return rendered['lines'][line_index].get('breakpoint')
+        return None
+
     def breakpoint_window_goto_breakpoint(self):
-        breakpoint_index = self.get_line() - 1
-        breakpoint = self.breakpoint_list[breakpoint_index]
-        self.goto_file(breakpoint['file'], breakpoint['line'], 0)
+        breakpoint = self.get_breakpoint()
+        if breakpoint:
+            self.goto_file(breakpoint['file'], breakpoint['line'], 0)
 
     def breakpoint_window_remove_breakpoint(self):
-        breakpoint_index = self.get_line() - 1
-        breakpoint = self.breakpoint_list[breakpoint_index]
-        if self.process_info['state'] == 'exited':
-            self.breakpoint_list.remove(breakpoint)
+        breakpoint = self.get_breakpoint()
+        if breakpoint and self.remove_breakpoint(breakpoint):
             self.update_window('breakpoint')
-            self.sync_signs(self.VIM_LLDB_SIGN_BREAKPOINT, self.breakpoint_list)
-        else:
-            if self.selected_target['handle'].BreakpointDelete(breakpoint['id']):
-                self.breakpoint_list.remove(breakpoint)
-                self.update_window('breakpoint')
-                self.sync_signs(self.VIM_LLDB_SIGN_BREAKPOINT, self.breakpoint_list)
-            else:
-                self.log_error('Cannot remove breakpoint')
+            self.sync_breakpoint_signs()
+
+    def update_logpoints(self):
+        self.logpoints = { breakpoint['id']: breakpoint['log'] for breakpoint in self.breakpoints if breakpoint['log'] and breakpoint['id'] is not None }
+
+    # NOTE: Change an option of the breakpoint under the cursor, and of its target breakpoint if it has one
+    def change_breakpoint_option(self, key, value):
+        breakpoint = self.get_breakpoint()
+        if breakpoint:
+            breakpoint[key] = value
+            if breakpoint['id'] is not None and self.breakpoint_target:
+                target_breakpoint = self.breakpoint_target.FindBreakpointByID(breakpoint['id'])
+                if target_breakpoint.IsValid():
+                    self.apply_breakpoint_options(target_breakpoint, breakpoint)
+            self.update_logpoints()
+            self.update_window('breakpoint')
+
+    # NOTE: Prompt for a breakpoint option. Returns None when user cancels input, which is told apart from an empty input that clears the option
+    def input_breakpoint_option(self, prompt, value):
+        return self.call('input', { 'prompt': prompt, 'default': value, 'cancelreturn': None })
+
+    # NOTE: Prompt for a non-negative integer option, an empty input clears it to None. Returns the number and whether the input is valid, cancelled input is invalid
+    def input_breakpoint_number(self, prompt, value):
+        text = self.input_breakpoint_option(prompt, '' if value is None else str(value))
+        if text is None:
+            return None, False
+        if text == '':
+            return None, True
+        if not text.isdigit():
+            self.log_error('Invalid number')
+            return None, False
+        return int(text), True
+
+    def breakpoint_window_change_condition(self):
+        breakpoint = self.get_breakpoint()
+        if breakpoint:
+            condition = self.input_breakpoint_option('Please change breakpoint condition:\n', breakpoint['condition'])
+            if condition is not None:
+                self.change_breakpoint_option('condition', condition.strip())
+
+    # NOTE: A logpoint doesn't stop the process, its message is written to the 'log' output stream when it's hit. Expressions in braces are evaluated in the top frame of the thread that hit it, e.g. 'i = {i}'
+    def breakpoint_window_change_log(self):
+        breakpoint = self.get_breakpoint()
+        if breakpoint:
+            log = self.input_breakpoint_option('Please change breakpoint log message:\n', breakpoint['log'])
+            if log is not None:
+                self.change_breakpoint_option('log', log.strip())
+
+    def breakpoint_window_change_ignore_count(self):
+        breakpoint = self.get_breakpoint()
+        if breakpoint:
+            ignore_count, is_valid = self.input_breakpoint_number('Please change breakpoint ignore count:\n', breakpoint['ignore_count'] or None)
+            if is_valid:
+                self.change_breakpoint_option('ignore_count', ignore_count or 0)
+
+    def breakpoint_window_change_thread(self):
+        breakpoint = self.get_breakpoint()
+        if breakpoint:
+            # NOTE: Default to the selected thread of the stopped process
+            thread = breakpoint['thread']
+            if thread is None and self.selected_thread_info:
+                thread = self.selected_thread_info['id']
+            thread, is_valid = self.input_breakpoint_number('Please change breakpoint thread:\n', thread)
+            if is_valid:
+                self.change_breakpoint_option('thread', thread)
 
     def output_window_next_stream(self):
-        stream_order = ['both', 'stdout', 'stderr']
+        stream_order = ['both', 'stdout', 'stderr', 'log']
         selected_stream_index = stream_order.index(self.selected_stream)
         selected_stream_index = (selected_stream_index + 1) % len(stream_order)
         self.selected_stream = stream_order[selected_stream_index]
         self.update_window('output')
 
     def output_window_prev_stream(self):
-        stream_order = ['both', 'stdout', 'stderr']
+        stream_order = ['both', 'stdout', 'stderr', 'log']
         selected_stream_index = stream_order.index(self.selected_stream)
         selected_stream_index = (selected_stream_index - 1 + len(stream_order)) % len(stream_order)
         self.selected_stream = stream_order[selected_stream_index]
@@ -753,63 +1499,132 @@ class Context:
     def get_watch(self, line = 0):
         if not line:
             line = self.get_line()
-        found_watch = None
-        def find_watch(watch_list, offset):
-            nonlocal found_watch
-            for watch in watch_list:
-                if offset == line:
-                    found_watch = watch
-                if watch['children']:
-                    offset = find_watch(watch['children'], offset + 1)
-                else:
-                    offset += 1
-            return offset
-        find_watch(self.watch_list, 1)
-        return found_watch
+        rendered = self.window_lines.get('watch')
+        if rendered and line <= len(rendered['lines']):
+            return rendered['lines'][line - 1].get('watch')
+        return None
+
+    # NOTE: Key of the watch values of the selected frame. Stops of expression evaluation don't count, since evaluating a watch expression would otherwise change the key
+    def get_watch_cache_key(self):
+        frame = self.get_selected_frame_info()['handle']
+        return (frame.GetThread().GetProcess().GetStopID(False), self.selected_thread_info['id'], frame.GetFrameID())
+
+    @staticmethod
+    def get_watch_path(watch):
+        path = []
+        while watch:
+            path.append(watch['expr'])
+            watch = watch['parent']
+        return tuple(reversed(path))
 
     def evaluate_expr(self, expr):
         watch = { 'expr': expr, 'children': [], 'parent': None }
         if self.process_info['state'] == 'stopped':
-            expr_list = expr.split('@')
-            if len(expr_list) > 2:
-                watch['value'] = None
+            cache_key = (*self.get_watch_cache_key(), (expr,))
+            cached_watch = self.watch_value_cache.get(cache_key)
+            if cached_watch:
+                watch.update(cached_watch)
             else:
-                expr = expr_list[0]
-                frame = self.get_selected_frame_info()['handle']
-                # NOTE: Do not evaluate expression if the expression is variable-like to avoid parsing overhead
-                if re.compile(r'^[a-zA-Z_][a-zA-Z0-9_]*$').match(expr):
-                    watch['value'] = frame.FindVariable(expr)
-                else:
-                    # NOTE: GetValueForVariablePath handles simple field accessor expressions (-> . * & [])
-                    watch['value'] = frame.GetValueForVariablePath(expr)
-                    if not watch['value'].IsValid():
-                        watch['value'] = frame.EvaluateExpression(expr)
-
-                if len(expr_list) > 1:
-                    comma_list = expr_list[1].split(',')
-                    try:
-                        if len(comma_list) == 2:
-                            offset = int(comma_list[0])
-                            length = int(comma_list[1])
-                            if offset >= 0 and length > 0:
-                                watch['special'] = { 'type': 'at', 'offset': offset, 'length': length }
-                            else:
-                                watch['value'] = None
-                        elif len(comma_list) == 1:
-                            length = int(comma_list[0])
-                            if length > 0:
-                                watch['special'] = { 'type': 'at', 'offset': 0, 'length': length }
-                            else:
-                                watch['value'] = None
-                        else:
-                            watch['value'] = None
-                    except ValueError:
-                        watch['value'] = None
+                self.evaluate_watch_value(watch, cache_key)
+                self.watch_value_cache[cache_key] = { key: watch[key] for key in ('value', 'special', 'status') if key in watch }
         else:
             # NOTE: We return None here instead of raising error since we want to be able to modify the watch window from exited state. This simplifies the caller
             watch['value'] = None
         return watch
 
+    def evaluate_watch_value(self, watch, cache_key):
+        expr = watch['expr']
+        expr_list = expr.split('@')
+        if len(expr_list) > 2:
+            watch['value'] = None
+        else:
+            expr = expr_list[0]
+            frame = self.get_selected_frame_info()['handle']
+            # NOTE: Do not evaluate expression if the expression is variable-like to avoid parsing overhead
+            if re.compile(r'^[a-zA-Z_][a-zA-Z0-9_]*$').match(expr):
+                watch['value'] = frame.FindVariable(expr)
+            else:
+                # NOTE: GetValueForVariablePath handles simple field accessor expressions (-> . * & [])
+                watch['value'] = frame.GetValueForVariablePath(expr)
+                if not watch['value'].IsValid():
+                    # NOTE: Expression evaluation compiles and runs code in the process, it's done in the background and the result is applied when it arrives
+                    watch['value'] = PlaceholderValue(watch['expr'], '<evaluating>')
+                    watch['status'] = 'pending'
+                    self.watch_queue.put((self.watch_generation, cache_key, frame, expr))
+
+            if len(expr_list) > 1:
+                comma_list = expr_list[1].split(',')
+                try:
+                    if len(comma_list) == 2:
+                        offset = int(comma_list[0])
+                        length = int(comma_list[1])
+                        if offset >= 0 and length > 0:
+                            watch['special'] = { 'type': 'at', 'offset': offset, 'length': length }
+                        else:
+                            watch['value'] = None
+                    elif len(comma_list) == 1:
+                        length = int(comma_list[0])
+                        if length > 0:
+                            watch['special'] = { 'type': 'at', 'offset': 0, 'length': length }
+                        else:
+                            watch['value'] = None
+                    else:
+                        watch['value'] = None
+                except ValueError:
+                    watch['value'] = None
+
+    # NOTE: Expressions evaluated for watches and logpoints are interrupted when they don't finish within the watch time budget
+    def get_expression_options(self):
+        options = lldb.SBExpressionOptions()
+        options.SetTimeoutInMicroSeconds(int(self.watch_timeout * 1000000))
+        options.SetTryAllThreads(False)
+        return options
+
+    # NOTE: Runs in the background worker thread. An expression that doesn't finish in time is interrupted, one that takes more than half of the time budget is marked slow.
+    # LLDB holds the target API lock for the whole evaluation, so LLDB calls on the Neovim thread (rendering values, stepping) still wait for it. This bounds how long the editor is blocked by the time budget instead of removing the wait
+    def watch_worker(self):
+        while True:
+            generation, cache_key, frame, expr = self.watch_queue.get()
+            if generation != self.watch_generation:
+                continue
+            try:
+                start_time = time.monotonic()
+                value = frame.EvaluateExpression(expr, self.get_expression_options())
+                elapsed_time = time.monotonic() - start_time
+                if value.GetError().Fail() and value.GetError().GetError() == lldb.eExpressionTimedOut:
+                    status = 'timeout'
+                elif elapsed_time > self.watch_timeout / 2:
+                    status = f'slow {int(elapsed_time * 1000)} ms'
+                else:
+                    status = None
+                self.handle_watch_result(generation, cache_key, value, status)
+            except Exception:
+                self.log_error(traceback.format_exc())
+
+    @neovim_thread()
+    def handle_watch_result(self, generation, cache_key, value, status):
+        if generation == self.watch_generation:
+            if status == 'timeout':
+                value = PlaceholderValue(cache_key[-1][0], '<timed out>')
+            cached_watch = self.watch_value_cache.get(cache_key)
+            if cached_watch:
+                cached_watch['value'] = value
+                cached_watch['status'] = status
+            # NOTE: Update the watch if it's still shown for the same frame, and expand it if it was expanded before the result arrived
+            if self.process_info['state'] == 'stopped' and cache_key[:-1] == self.get_watch_cache_key():
+                for watch in self.watch_list:
+                    if watch.get('status') == 'pending' and watch['expr'] == cache_key[-1][0]:
+                        watch['value'] = value
+                        watch['status'] = status
+                        if watch.pop('expand', False):
+                            watch['children'] = self.get_watch_children(watch)
+                self.update_window('watch')
+
+    # NOTE: Drop the cached watch values and the results of evaluations still in progress
+    def clear_watch_value_cache(self):
+        self.watch_value_cache.clear()
+        self.watch_generation += 1
+
     def watch_window_add_watch(self):
         if self.process_info['state'] != 'running':
             expr = self.call('input', 'Please add watch expression:\n')
@@ -825,8 +1640,8 @@ class Context:
 
     def watch_window_change_watch(self):
         if self.process_info['state'] != 'running':
-            if self.watch_list:
-                watch = self.get_watch()
+            watch = self.get_watch()
+            if watch:
                 while watch['parent']:
                     watch = watch['parent']
                 expr = self.call('input', 'Please change watch expression:\n', watch['expr'])
@@ -839,8 +1654,8 @@ class Context:
 
     def watch_window_remove_watch(self):
         if self.process_info['state'] != 'running':
-            if self.watch_list:
-                watch = self.get_watch()
+            watch = self.get_watch()
+            if watch:
                 while watch['parent']:
                     watch = watch['parent']
                 self.watch_list.remove(watch)
@@ -848,27 +1663,82 @@ class Context:
         else:
             self.log_error('Cannot modify watch window from running state')
 
-    def get_watch_children(self, watch):
+    # NOTE: Read the elements of a pointer@length watch of a primitive element type from index first to last (relative to the offset) in one memory read and decode them at once, instead of creating a value per element.
+    # Only the requested page is read, so a page takes the same time however long the range is. Returns the decoded values and their formatter, or None when the elements cannot be read in bulk
+    def read_watch_memory(self, watch, first, last):
+        special = watch['special']
+        # NOTE: The layout of the elements is looked up once per watch, which is evaluated again on every stop
+        if 'memory_layout' not in special:
+            special['memory_layout'] = None
+            value = watch['value']
+            value_type = value.GetType().GetCanonicalType()
+            if value_type.IsPointerType():
+                element_type = value_type.GetPointeeType()
+                address = value.GetValueAsUnsigned()
+            elif value_type.IsArrayType():
+                element_type = value_type.GetArrayElementType()
+                address = value.GetLoadAddress()
+            else:
+                return None
+            memory_format, formatter = get_memory_format(element_type)
+            process = value.GetProcess()
+            if memory_format and address and address != lldb.LLDB_INVALID_ADDRESS and process.IsValid():
+                byte_order = '<' if process.GetByteOrder() == lldb.eByteOrderLittle else '>'
+                special['memory_layout'] = { 'process': process, 'address': address, 'element_size': element_type.GetByteSize(), 'format': f'{byte_order}{{}}{memory_format}', 'formatter': formatter }
+
+        layout = special['memory_layout']
+        if layout and last > first:
+            size = (last - first) * layout['element_size']
+            error = lldb.SBError()
+            data = layout['process'].ReadMemory(layout['address'] + (special['offset'] + first) * layout['element_size'], size, error)
+            if error.Success() and len(data) == size:
+                return struct.unpack(layout['format'].format(last - first), data), layout['formatter']
+        return None
+
+    # NOTE: Children are loaded in pages starting from start, count defaults to the page size. When there are more children a 'more' pseudo-node is appended, which loads the next page when expanded.
+    # The number of children is capped when it's requested, so that loading a page takes the same time however large the value is
+    def get_watch_children(self, watch, start = 0, count = None):
+        if count is None:
+            count = self.watch_page_size
         value = watch['value']
-        if value and value.IsValid():
-            if 'special' in watch:
-                indices = list(range(watch['special']['offset'], watch['special']['offset'] + watch['special']['length']))
-                children = [value.GetValueForExpressionPath(f'[{index}]') for index in indices]
-                children = list(map(lambda v: { 'expr': v.GetName(), 'value': v, 'children': [], 'parent': watch }, children))
+        values = []
+        has_more = False
+        # NOTE: Values kept from the last stop are stale once the process exits, even though they still report valid while the target is alive
+        if self.process_info['state'] == 'stopped' and value and value.IsValid() and not isinstance(value, PlaceholderValue):
+            cache_key = (*self.get_watch_cache_key(), self.get_watch_path(watch), start, count)
+            if cache_key in self.watch_value_cache:
+                values, has_more = self.watch_value_cache[cache_key]
             else:
-                if value.MightHaveChildren():
-                    children = [value.GetChildAtIndex(index) for index in range(value.GetNumChildren())]
-                    children = list(map(lambda v: { 'expr': v.GetName(), 'value': v, 'children': [], 'parent': watch }, children))
-                else:
-                    children = []
-        else:
-            children = []
+                if 'special' in watch:
+                    length = watch['special']['length']
+                    indices = range(watch['special']['offset'] + start, watch['special']['offset'] + min(length, start + count))
+                    memory = self.read_watch_memory(watch, start, start + len(indices))
+                    if memory:
+                        memory_values, formatter = memory
+                        values = [MemoryValue(f'[{index}]', memory_values, value_index, formatter) for value_index, index in enumerate(indices)]
+                    else:
+                        values = [value.GetValueForExpressionPath(f'[{index}]') for index in indices]
+                    has_more = start + count < length
+                elif value.MightHaveChildren():
+                    child_count = value.GetNumChildren(start + count + 1)
+                    values = [value.GetChildAtIndex(index) for index in range(start, min(child_count, start + count))]
+                    has_more = child_count > start + count
+                self.watch_value_cache[cache_key] = (values, has_more)
+        children = [{ 'expr': v.GetName(), 'value': v, 'children': [], 'parent': watch } for v in values]
+        if has_more:
+            children.append({ 'expr': '...', 'value': None, 'children': [], 'parent': watch, 'more': True })
         return children
 
     def watch_window_expand_watch(self):
         if self.process_info['state'] != 'running':
             watch = self.get_watch()
-            if not watch['children']:
+            if watch and watch.get('more'):
+                # NOTE: Replace the 'more' pseudo-node with the next page
+                parent = watch['parent']
+                loaded_children = parent['children'][:-1]
+                parent['children'] = loaded_children + self.get_watch_children(parent, len(loaded_children))
+                self.update_window('watch')
+            elif watch and not watch['children']:
                 watch['children'] = self.get_watch_children(watch)
                 if watch['children']:
                     self.update_window('watch')
@@ -879,90 +1749,93 @@ class Context:
         if self.process_info['state'] != 'running':
             watch = self.get_watch()
             # NOTE: If current watch cannot be collapsed but there's parent, collapse parent instead
-            if not watch['children'] and watch['parent']:
+            if watch and not watch['children'] and watch['parent']:
                 watch = watch['parent']
-            if watch['children']:
+            if watch and watch['children']:
                 watch['children'] = []
                 self.update_window('watch')
         else:
             self.log_error('Cannot modify watch window from running state')
 
-    # NOTE: Reevaluation takes care of the cases where the same variable mean different things in different frames. It maintains the watch structure as long as possible
+    # NOTE: Reevaluation takes care of the cases where the same variable mean different things in different frames. It maintains the watch structure as long as possible.
+    # Expanded watches are indexed by path (root index followed by the child names) first, so that each new child is matched with a dictionary lookup
     def reevaluate_watch_list(self):
-        def expand_children(watch, curr_children):
-            if curr_children:
-                watch['children'] = self.get_watch_children(watch)
+        def index_expanded_watches(watch_list, path):
+            for watch in watch_list:
+                if watch['children']:
+                    child_path = path + (watch['expr'],)
+                    # NOTE: Keep the first of children with the same name
+                    expanded_watches.setdefault(child_path, watch)
+                    index_expanded_watches(watch['children'], child_path)
+
+        def expand_children(watch, path):
+            curr_watch = expanded_watches.get(path)
+            if curr_watch and watch.get('status') == 'pending':
+                watch['expand'] = True
+            elif curr_watch:
+                # NOTE: Load as many pages as were loaded before
+                loaded_count = len([child for child in curr_watch['children'] if not child.get('more')])
+                watch['children'] = self.get_watch_children(watch, 0, max(loaded_count, self.watch_page_size))
+                # NOTE: We want to expand child if the same name is expanded in the current watch structure
                 for child in watch['children']:
-                    match_child = None
-                    for curr_child in curr_children:
-                        if curr_child['expr'] == child['expr']:
-                            match_child = curr_child
-                            break
-                    # NOTE: We want to expand child if the same name is expanded in the current watch structure
-                    if match_child:
-                        expand_children(child, match_child['children'])
+                    expand_children(child, path + (child['expr'],))
 
         if self.process_info['state'] == 'stopped':
-            for watch in self.watch_list:
-                curr_children = watch['children']
+            expanded_watches = {}
+            for index, watch in enumerate(self.watch_list):
+                if watch['children']:
+                    expanded_watches[(index,)] = watch
+                    index_expanded_watches(watch['children'], (index,))
+            for index, watch in enumerate(self.watch_list):
                 new_watch = self.evaluate_expr(watch['expr'])
-                list_replace(self.watch_list, watch, new_watch)
-                expand_children(new_watch, curr_children)
+                self.watch_list[index] = new_watch
+                expand_children(new_watch, (index,))
 
+    @neovim_thread(coalesce='state')
     def handle_process_stopped(self, process_info, stopped_thread_info):
-        def get_top_frame(thread_info):
-            for frame_info in thread_info['frames']:
-                if frame_info['type'] == 'full':
-                    return frame_info
-            return None
-
-        if self.thread_guard():
-            self.process_info = process_info
-            # NOTE: Select stopped thread and top frame (with debugging info) for each thread
-            self.selected_thread_info = stopped_thread_info
-            self.selected_frame_info_list = [get_top_frame(thread_info) for thread_info in process_info['threads']]
-            self.update_window('stack')
-            self.update_process_cursor()
-            self.goto_selected_frame()
-            self.reevaluate_watch_list()
-            self.update_window('watch')
-            self.async_lock.release()
+        self.process_info = process_info
+        self.clear_watch_value_cache()
+        # NOTE: Select stopped thread, the top frame (with debugging info) of each thread is selected when the thread is unwound
+        self.selected_thread_info = stopped_thread_info
+        if self.is_breakpoint_locations_stale and self.breakpoint_target:
+            self.is_breakpoint_locations_stale = False
+            if self.refresh_breakpoint_locations(self.breakpoint_target):
+                self.update_window('breakpoint')
+        self.update_window('stack')
+        self.update_process_cursor()
+        self.goto_selected_frame()
+        self.reevaluate_watch_list()
+        self.update_window('watch')
 
+    @neovim_thread(coalesce='state')
     def handle_process_exited(self):
-        if self.thread_guard():
-            self.process_info = { 'state': 'exited', 'threads': [] }
-            self.selected_thread_info = None
-            self.selected_frame_info_list = []
-            self.update_window('stack')
-            self.update_process_cursor()
-            self.reevaluate_watch_list()
-            self.update_window('watch')
-            self.unlock_files()
-            self.async_lock.release()
-
+        self.process_info = { 'state': 'exited', 'threads': [] }
+        self.selected_thread_info = None
+        self.clear_watch_value_cache()
+        self.update_window('stack')
+        self.update_process_cursor()
+        self.reevaluate_watch_list()
+        self.update_window('watch')
+        self.unlock_files()
+
+    @neovim_thread(coalesce='state')
     def handle_process_running(self):
-        if self.thread_guard():
-            self.process_info = { 'state': 'running', 'threads': [] }
-            self.selected_thread_info = None
-            self.selected_frame_info_list = []
-            self.update_window('stack')
-            self.update_process_cursor()
-            self.update_window('watch')
-            self.async_lock.release()
+        self.process_info = { 'state': 'running', 'threads': [] }
+        self.selected_thread_info = None
+        self.clear_watch_value_cache()
+        self.update_window('stack')
+        self.update_process_cursor()
+        self.update_window('watch')
 
-    def handle_process_stdout(self, output):
-        if self.thread_guard():
-            self.process_output['both'] += output
-            self.process_output['stdout'] += output
-            self.update_window('output')
-            self.async_lock.release()
+    def get_output_log(self, stream):
+        return self.log_output if stream == 'log' else self.process_output
 
-    def handle_process_stderr(self, output):
-        if self.thread_guard():
-            self.process_output['both'] += output
-            self.process_output['stderr'] += output
-            self.update_window('output')
-            self.async_lock.release()
+    # NOTE: Output arrives as a list of (stream, text) chunks coalesced by the event loop
+    @neovim_thread()
+    def handle_process_output(self, chunks):
+        for stream, text in chunks:
+            self.get_output_log(stream).append(stream, text)
+        self.append_output_window(''.join(text for stream, text in chunks if OutputLog.in_view(self.selected_stream, stream)))
 
 def event_loop(context):
     def get_process_info(process):
@@ -992,40 +1865,159 @@ def event_loop(context):
             thread_info['handle'] = thread
             thread_info['id'] = thread.GetIndexID()
             thread_info['tid'] = thread.GetThreadID()
-
-            thread_info['frames'] = []
-            for frame in thread:
-                frame_info = {}
-                thread_info['frames'].append(frame_info)
-
-                frame_info['handle'] = frame
-                frame_info['module'] = frame.GetModule().GetFileSpec().fullpath or ''
-                frame_info['function'] = frame.GetDisplayFunctionName() or ''
-                frame_info['type'] = 'full' if frame.GetFunction().IsValid() else 'none'
-                if frame_info['type'] == 'full':
-                    line_entry = frame.GetLineEntry()
-                    frame_info['file'] = line_entry.GetFileSpec().fullpath or ''
-                    frame_info['line'] = line_entry.GetLine()
-                    frame_info['column'] = line_entry.GetColumn()
-                    if not os.path.isfile(frame_info['file']):
-                        frame_info['type'] = 'partial'
+            # NOTE: Frames are unwound by Context.unwind_thread
+            thread_info['frames'] = None
+            thread_info['selected_frame'] = None
 
             stop_reason = thread.GetStopReason() 
-            if stop_reason != lldb.eStopReasonNone:
+            if stop_reason != lldb.eStopReasonNone and not stopped_thread_info:
                 stopped_thread_info = thread_info
+        if not stopped_thread_info and process_info['threads']:
+            stopped_thread_info = process_info['threads'][0]
+
+        # NOTE: Only the stopped thread is unwound before the UI is notified unless the unwind mode is eager, so the stop latency doesn't depend on the thread count
+        if context.unwind_mode == 'eager':
+            for thread_info in process_info['threads']:
+                context.unwind_thread(thread_info)
+        elif stopped_thread_info:
+            context.unwind_thread(stopped_thread_info)
         return process_info, stopped_thread_info
 
+    # NOTE: In background unwind mode, the other threads are unwound after the stop is handed to the Neovim thread. A newer stop abandons the pass
+    def unwind_threads(process_info):
+        try:
+            for thread_info in process_info['threads']:
+                if process_info is not latest_process_info:
+                    break
+                context.unwind_thread(thread_info)
+        except Exception:
+            context.log_error(traceback.format_exc())
+
     def read_output(stream):
-        output = ''
+        output_chunks = []
         output_chunk = stream(4096)
         while output_chunk:
-            output += output_chunk
+            output_chunks.append(output_chunk)
             output_chunk = stream(4096)
-        return output
-
+        return ''.join(output_chunks)
+
+    # NOTE: Output is buffered here and flushed to the Neovim thread at a bounded rate, when the flush interval has passed or enough output is buffered.
+    # While the previous flush is not handled yet, we keep buffering instead of queueing more renders, and drop the oldest buffered output beyond the output limit
+    pending_output = collections.deque()
+    pending_output_size = 0
+    # NOTE: Buffered size per output log, keyed by the output log the chunks go to
+    pending_log_size = {}
+    pending_output_lock = threading.Lock()
+    flush_lock = threading.Lock()
+    flush_timer = None
+    # NOTE: Number of flushes dispatched but not handled yet. A forced flush can be queued behind an unhandled one, so a single flag would be cleared while a flush is still queued
+    queued_flush_count = 0
+
+    def start_flush_timer():
+        nonlocal flush_timer
+        flush_timer = threading.Timer(context.output_flush_interval, flush_output, args=(False,))
+        flush_timer.daemon = True
+        flush_timer.start()
+
+    def handle_output(chunks):
+        nonlocal queued_flush_count
+        try:
+            context.handle_process_output(chunks)
+        finally:
+            with pending_output_lock:
+                queued_flush_count -= 1
+
+    # NOTE: A forced flush (before a state change) is queued even if the previous flush is not handled yet, the dispatch queue keeps them in order
+    def flush_output(force = True):
+        nonlocal pending_output, pending_output_size, flush_timer, queued_flush_count
+        try:
+            with flush_lock:
+                with pending_output_lock:
+                    if flush_timer:
+                        flush_timer.cancel()
+                        flush_timer = None
+                    if not force and queued_flush_count > 0:
+                        if pending_output:
+                            start_flush_timer()
+                        return
+                    chunks = pending_output
+                    pending_output = collections.deque()
+                    pending_output_size = 0
+                    pending_log_size.clear()
+                    if chunks:
+                        queued_flush_count += 1
+                if chunks:
+                    # NOTE: Merge consecutive chunks of the same stream
+                    merged_chunks = []
+                    for stream, text in chunks:
+                        if merged_chunks and merged_chunks[-1][0] == stream:
+                            merged_chunks[-1][1].append(text)
+                        else:
+                            merged_chunks.append((stream, [text]))
+                    context.dispatch(handle_output, [(stream, ''.join(texts)) for stream, texts in merged_chunks])
+        except Exception:
+            context.log_error(traceback.format_exc())
+
+    # NOTE: Buffered logpoint messages and process output are trimmed separately against the limits of their own output logs
+    def buffer_output(stream, text):
+        nonlocal pending_output_size
+        if text:
+            with pending_output_lock:
+                pending_output.append((stream, text))
+                pending_output_size += len(text)
+                output_log = context.get_output_log(stream)
+                pending_log_size[output_log] = pending_log_size.get(output_log, 0) + len(text)
+                while pending_log_size[output_log] > output_log.limit:
+                    index, (oldest_stream, oldest_text) = next((index, chunk) for index, chunk in enumerate(pending_output) if context.get_output_log(chunk[0]) is output_log)
+                    if index == len(pending_output) - 1:
+                        break
+                    del pending_output[index]
+                    pending_output_size -= len(oldest_text)
+                    pending_log_size[output_log] -= len(oldest_text)
+                flush_now = pending_output_size >= context.output_flush_size
+                if not flush_now and not flush_timer:
+                    start_flush_timer()
+            if flush_now:
+                flush_output(False)
+
+    def evaluate_log_expr(frame, expr):
+        # NOTE: Variable paths are much cheaper than expression evaluation, which compiles and runs code in the process
+        value = frame.GetValueForVariablePath(expr)
+        if not value.IsValid() or value.GetError().Fail():
+            value = frame.EvaluateExpression(expr, context.get_expression_options())
+        if value.GetError().Fail():
+            return f'<{value.GetError().GetCString()}>'
+        return value.GetSummary() or value.GetValue() or ''
+
+    # NOTE: Handle a stop where every thread stopped for a reason stopped at a logpoint, by buffering the log messages as output. Returns whether the stop is handled, in which case the process should continue without notifying the UI
+    def handle_logpoint_stop(process):
+        logpoints = context.logpoints
+        if not logpoints:
+            return False
+        messages = []
+        for thread in process:
+            stop_reason = thread.GetStopReason()
+            if stop_reason in (lldb.eStopReasonInvalid, lldb.eStopReasonNone):
+                continue
+            if stop_reason != lldb.eStopReasonBreakpoint:
+                return False
+            message = logpoints.get(thread.GetStopReasonDataAtIndex(0))
+            if message is None:
+                return False
+            frame = thread.GetFrameAtIndex(0)
+            messages.append(LOGPOINT_EXPR_PATTERN.sub(lambda match: evaluate_log_expr(frame, match.group(1)), message))
+        for message in messages:
+            buffer_output('log', f'{message}\n')
+        return bool(messages)
+
+    latest_process_info = None
+    # NOTE: Whether the process was continued from a logpoint stop, the running event that follows is not shown either
+    is_logpoint_continued = False
     try:
         listener = context.debugger.GetListener()
         listener.StartListeningForEvents(context.exit_broadcaster, 0xffffffff)
+        listener.StartListeningForEventClass(context.debugger, lldb.SBTarget.GetBroadcasterClassName(),
+                                             lldb.SBTarget.eBroadcastBitModulesLoaded | lldb.SBTarget.eBroadcastBitModulesUnloaded | lldb.SBTarget.eBroadcastBitSymbolsLoaded)
         while True:
             event = lldb.SBEvent()
             if listener.WaitForEvent(1, event):
@@ -1034,23 +2026,42 @@ def event_loop(context):
                     event_type = event.GetType();
                     if event_type == lldb.SBProcess.eBroadcastBitStateChanged:
                         state = lldb.SBProcess.GetStateFromEvent(event)
+                        if state == lldb.eStateStopped and not lldb.SBProcess.GetRestartedFromEvent(event) and handle_logpoint_stop(process):
+                            is_logpoint_continued = True
+                            process.Continue()
+                            continue
+                        if state == lldb.eStateRunning and is_logpoint_continued:
+                            is_logpoint_continued = False
+                            continue
+                        is_logpoint_continued = False
+                        # NOTE: Buffered output is flushed before any state change, so that it's not held back behind the stop
+                        flush_output()
                         if state == lldb.eStateStopped:
-                            context.async_lock.acquire()
-                            context.handle_process_stopped(*get_process_info(process))
+                            process_info, stopped_thread_info = get_process_info(process)
+                            latest_process_info = process_info
+                            context.handle_process_stopped(process_info, stopped_thread_info)
+                            if context.unwind_mode == 'background':
+                                threading.Thread(target=unwind_threads, args=(process_info,), daemon=True).start()
                         elif state == lldb.eStateExited:
-                            context.async_lock.acquire()
+                            latest_process_info = None
                             context.handle_process_exited()
                         elif state == lldb.eStateRunning:
-                            context.async_lock.acquire()
+                            latest_process_info = None
                             context.handle_process_running()
                     elif event_type == lldb.SBProcess.eBroadcastBitSTDOUT:
-                        context.async_lock.acquire()
-                        context.handle_process_stdout(read_output(process.GetSTDOUT))
+                        buffer_output('stdout', read_output(process.GetSTDOUT))
                     elif event_type == lldb.SBProcess.eBroadcastBitSTDERR:
-                        context.async_lock.acquire()
-                        context.handle_process_stderr(read_output(process.GetSTDERR))
+                        buffer_output('stderr', read_output(process.GetSTDERR))
+                elif lldb.SBTarget.EventIsTargetEvent(event):
+                    # NOTE: Cached frame records may point into modules that were unloaded or gained symbols, and breakpoints may resolve differently
+                    context.clear_frame_cache()
+                    context.is_breakpoint_locations_stale = True
                 elif event.BroadcasterMatchesRef(context.exit_broadcaster):
                     break
     except Exception:
         context.log_error(traceback.format_exc())
+    finally:
+        with pending_output_lock:
+            if flush_timer:
+                flush_timer.cancel()
 
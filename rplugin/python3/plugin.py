@@ -1,11 +1,22 @@
 # NOTE: Vim runtime cannot load local .py package by default for some reason, we have to manually manipulate the loading path
 import sys
+import time
+import functools
 from os import path
 sys.path.append(path.dirname(__file__))
 
 import pynvim
-import lldb
-from context import Context
+
+# NOTE: lldb and the context module are imported when the debugger starts, so that Neovim sessions which never debug don't pay for loading LLDB
+PLUGIN_LOAD_TIME = time.perf_counter()
+
+# NOTE: Start the debugger on the first call of a VimLLDB_* function
+def started(function):
+    @functools.wraps(function)
+    def wrapper(self, *args):
+        self.startup()
+        return function(self, *args)
+    return wrapper
 
 @pynvim.plugin
 class Handler(object):
@@ -13,111 +24,211 @@ class Handler(object):
         self.nvim = nvim
         self.started = False
         self.context = None
+        self.lazy_startup = None
+        self.startup_timings = None
 
     @pynvim.function('VimLLDB_SelectTarget')
+    @started
     def select_target(self, args):
         self.context.select_target(args[0])
 
     @pynvim.function('VimLLDB_ToggleDebugger')
+    @started
     def toggle_debugger(self, args):
         self.context.toggle_debugger()
 
     @pynvim.function('VimLLDB_Launch')
+    @started
     def launch(self, args):
         self.context.launch()
 
     @pynvim.function('VimLLDB_StepOver')
+    @started
     def step_over(self, args):
         self.context.step_over()
 
     @pynvim.function('VimLLDB_StepInto')
+    @started
     def step_into(self, args):
         self.context.step_into()
 
     @pynvim.function('VimLLDB_StepOut')
+    @started
     def step_out(self, args):
         self.context.step_out()
 
     @pynvim.function('VimLLDB_Resume')
+    @started
     def resume(self, args):
         self.context.resume()
 
     @pynvim.function('VimLLDB_Pause')
+    @started
     def stop(self, args):
         self.context.pause()
 
     @pynvim.function('VimLLDB_Kill')
+    @started
     def kill(self, args):
         self.context.kill()
 
     @pynvim.function('VimLLDB_ToggleBreakpoint')
+    @started
     def toggle_breakpoint(self, args):
         self.context.toggle_breakpoint()
 
     @pynvim.function('VimLLDB_StackWindow_GotoFrame')
+    @started
     def stack_window_goto_frame(self, args):
         self.context.stack_window_goto_frame()
 
     @pynvim.function('VimLLDB_StackWindow_NextThread')
+    @started
     def stack_window_next_thread(self, args):
         self.context.stack_window_next_thread()
 
     @pynvim.function('VimLLDB_StackWindow_PrevThread')
+    @started
     def stack_window_prev_thread(self, args):
         self.context.stack_window_prev_thread()
 
     @pynvim.function('VimLLDB_BreakpointWindow_GotoBreakpoint')
+    @started
     def breakpoint_window_goto_breakpoint(self, args):
         self.context.breakpoint_window_goto_breakpoint()
 
     @pynvim.function('VimLLDB_BreakpointWindow_RemoveBreakpoint')
+    @started
     def breakpoint_window_remove_breakpoint(self, args):
         self.context.breakpoint_window_remove_breakpoint()
 
+    @pynvim.function('VimLLDB_BreakpointWindow_ChangeCondition')
+    @started
+    def breakpoint_window_change_condition(self, args):
+        self.context.breakpoint_window_change_condition()
+
+    @pynvim.function('VimLLDB_BreakpointWindow_ChangeIgnoreCount')
+    @started
+    def breakpoint_window_change_ignore_count(self, args):
+        self.context.breakpoint_window_change_ignore_count()
+
+    @pynvim.function('VimLLDB_BreakpointWindow_ChangeThread')
+    @started
+    def breakpoint_window_change_thread(self, args):
+        self.context.breakpoint_window_change_thread()
+
+    @pynvim.function('VimLLDB_BreakpointWindow_ChangeLog')
+    @started
+    def breakpoint_window_change_log(self, args):
+        self.context.breakpoint_window_change_log()
+
     @pynvim.function('VimLLDB_WatchWindow_AddWatch')
+    @started
     def watch_window_add_watch(self, args):
         self.context.watch_window_add_watch()
 
     @pynvim.function('VimLLDB_WatchWindow_ChangeWatch')
+    @started
     def watch_window_change_watch(self, args):
         self.context.watch_window_change_watch()
 
     @pynvim.function('VimLLDB_WatchWindow_RemoveWatch')
+    @started
     def watch_window_remove_watch(self, args):
         self.context.watch_window_remove_watch()
 
     @pynvim.function('VimLLDB_WatchWindow_ExpandWatch')
+    @started
     def watch_window_expand_watch(self, args):
         self.context.watch_window_expand_watch()
 
     @pynvim.function('VimLLDB_WatchWindow_CollapseWatch')
+    @started
     def watch_window_collapse_watch(self, args):
         self.context.watch_window_collapse_watch()
 
     @pynvim.function('VimLLDB_OutputWindow_NextStream')
+    @started
     def output_window_next_stream(self, args):
         self.context.output_window_next_stream()
 
     @pynvim.function('VimLLDB_OutputWindow_PrevStream')
+    @started
     def output_window_prev_stream(self, args):
         self.context.output_window_prev_stream()
 
+    # NOTE: Returns the current and the highest number of handler calls waiting for the Neovim thread
+    @pynvim.function('VimLLDB_DispatchQueueDepth', sync=True)
+    def dispatch_queue_depth(self, args):
+        if self.started:
+            return self.context.get_dispatch_queue_depth()
+        return {}
+
+    # NOTE: Returns how long the debugger startup took in milliseconds and when it happened, an empty dictionary if the debugger hasn't started
+    @pynvim.function('VimLLDB_StartupTime', sync=True)
+    def startup_time(self, args):
+        return self.startup_timings or {}
+
     @pynvim.autocmd('BufEnter')
     def buffer_sync(self):
-        # NOTE: BufEnter is called on vim startup, initialize here instead of VimEnter because VimEnter is called after all buffers are loaded
-        self.startup()
-        # NOTE: When a new buffer enters, we should display the signs and lock the files correctly.
-        self.context.buffer_sync()
-
-    # NOTE: When text is changed, the sign positions might change. We need to sync this back with current breakpoint list
-    @pynvim.autocmd('TextChanged')
-    @pynvim.autocmd('TextChangedI')
-    @pynvim.autocmd('TextChangedP')
-    def buffer_sync_back(self):
-        # NOTE: In some cases TextChanged can be triggered before (or concurrently?) with BufEnter, so we call startup here as well
-        self.startup()
-        # NOTE: When text changes, the sign positions may change and we need to get that information back into our in-memory object representation
-        self.context.buffer_sync_back()
+        # NOTE: BufEnter is called on vim startup. Unless g:vim_lldb_lazy_startup is 0, the debugger is started by the first VimLLDB_* call instead, and until then there are no breakpoints or process to show
+        if self.lazy_startup is None:
+            self.lazy_startup = bool(self.nvim.vars.get('vim_lldb_lazy_startup', 1))
+        if self.started or not self.lazy_startup:
+            # NOTE: Initialize here instead of VimEnter because VimEnter is called after all buffers are loaded
+            self.startup()
+            # NOTE: When a new buffer enters, we should display the signs and lock the files correctly.
+            self.context.buffer_sync()
+
+    # NOTE: When text is changed, the sign positions might change. We need to sync this back with current breakpoint list.
+    # This is called from buffer-local autocmds that the context installs only on buffers with breakpoints, see Context.update_sync_back_autocmds
+    @pynvim.function('VimLLDB_BufferSyncBack')
+    def buffer_sync_back(self, args):
+        if self.started:
+            # NOTE: When text changes, the sign positions may change and we need to get that information back into our in-memory object representation
+            self.context.buffer_sync_back(args[0])
+
+    # NOTE: Keep the buffer and debugger window registries up to date
+    @pynvim.autocmd('BufAdd', eval='[str2nr(expand("<abuf>")), expand("<afile>:p")]')
+    def buffer_add(self, args):
+        if self.started:
+            self.context.register_buffer(*args)
+
+    # NOTE: A renamed buffer is registered under its new name, or dropped if it's not listed
+    @pynvim.autocmd('BufFilePost', eval='[str2nr(expand("<abuf>")), buflisted(str2nr(expand("<abuf>"))) ? expand("<afile>:p") : ""]')
+    def buffer_file(self, args):
+        if self.started:
+            self.context.register_buffer(*args)
+
+    @pynvim.autocmd('BufDelete', eval='str2nr(expand("<abuf>"))')
+    def buffer_delete(self, buffer):
+        if self.started:
+            self.context.unregister_buffer(buffer)
+
+    # NOTE: Window variables are not copied when a window is split, a split of a debugger window is recognized by its buffer instead
+    @pynvim.autocmd('WinNew', eval='[win_getid(), winbufnr(0)]')
+    def window_new(self, args):
+        if self.started:
+            self.context.register_split_window(*args)
+
+    @pynvim.autocmd('WinClosed', eval='str2nr(expand("<afile>"))')
+    def window_closed(self, window):
+        if self.started:
+            self.context.unregister_window(window)
+
+    # NOTE: Source files may be created or removed by writing buffers or by other programs, forget which files exist so that frames are checked again.
+    # Each autocmd needs its own method since pynvim keeps only one autocmd spec per method
+    @pynvim.autocmd('BufWritePost')
+    def buffer_written(self):
+        self.file_system_sync()
+
+    @pynvim.autocmd('FocusGained')
+    def focus_gained(self):
+        self.file_system_sync()
+
+    def file_system_sync(self):
+        if self.started:
+            self.context.clear_source_file_cache()
 
     @pynvim.autocmd('VimLeavePre')
     def shutdown(self):
@@ -128,7 +239,22 @@ class Handler(object):
 
     def startup(self):
         if not self.started:
+            start_time = time.perf_counter()
+            import lldb
+            from context import Context
+            import_time = time.perf_counter()
             lldb.SBDebugger.Initialize()
+            initialize_time = time.perf_counter()
             self.context = Context(self.nvim)
+            context_time = time.perf_counter()
             self.started = True
 
+            self.startup_timings = {
+                'lazy': bool(self.lazy_startup),
+                'deferred': round((start_time - PLUGIN_LOAD_TIME) * 1000, 3),
+                'import': round((import_time - start_time) * 1000, 3),
+                'initialize': round((initialize_time - import_time) * 1000, 3),
+                'context': round((context_time - initialize_time) * 1000, 3),
+                'total': round((context_time - start_time) * 1000, 3),
+            }
+